@@ -5,7 +5,15 @@ wheel_base = 77  # mm (increase = spiral clockwise)
 # stepper parameters
 steps_rev = 512    # 512 for 64x gearbox, 128 for 16x gearbox
 delay_time = 3     # time between steps in ms (too quick will freeze motors)
+                   # moves start and end at this rate
+cruise_delay = 3   # time between steps in ms in the middle of a move
+min_delay = 1.5    # cruise_delay at speed(0), only reached on long moves
+ramp_steps = 64    # steps taken to speed up to cruise_delay
 invert_direction = False  # change if turtle running backward
+step_mode = 'full' # 'wave' (low current), 'full' (torque) or 'half' (smooth)
+hold_time = 0.2    # s idle after a move before holding on one coil per motor
+release_time = 2   # s idle after a move before switching the coils off
+                   # (None for either to never do it)
 
 # servo parameters
 PEN_DOWN = 140     # angle of servo when pen is down
@@ -12,6 +12,9 @@ import calibration
 import pulseio
 import pwmio
 import simpleio
+from stepper import StepperBank, Scheduler, Power, Move, motion_directions, MODES, FORWARD
+# speeds, distance() and getBearing() are turtle commands too
+from planner import Planner, speeds, distance, getBearing, getBearing2
 
 # on the ItsyBitsy M0 Express, use dotstar
 import adafruit_dotstar
@@ -58,328 +61,366 @@ for wire in L_stepper:
 for wire in R_stepper:
     wire.direction = digitalio.Direction.OUTPUT
 
-# stepper patterns
-patterns = [[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1]]
+# stepper patterns of the drive mode in use, see set_step_mode()
+step_mode = calibration.step_mode
+patterns = MODES[step_mode]
 
-_x = 0
-_y = 0
-_heading = 0
-frac_error = 0
-spacer = ''
+L_bank = StepperBank(L_stepper, patterns)
+R_bank = StepperBank(R_stepper, patterns)
 
-servo = adafruit_motor.servo.Servo(pwm, min_pulse=calibration.min_pulse,
-                                   max_pulse=calibration.max_pulse)
+# direction of each motor in each motion, for drive()
+_directions = ()
 
+# paces the phases of every move; its overruns and worst fields report
+# phases that could not be started on time
+scheduler = Scheduler()
 
+# eases off the coils between moves, see stepper.Power and pause(); its
+# energised and holding fields count the time spent in each, see
+# energised_time()
+power = Power((L_bank, R_bank), calibration.hold_time, calibration.release_time)
 
-def setDebug(val):
-    global DEBUG
-    DEBUG = val
+# Motion profile: every move speeds up from calibration.delay_time to
+# _cruise (in ns), taking the periods in _ramp, and slows down the
+# same way before it ends. Moves too short to reach _cruise turn around
+# halfway, so the profile is a trapezoid or a triangle.
+_cruise = 0
+_ramp = ()
 
 
-def step(distance):
-    steps = distance * calibration.steps_rev/(calibration.wheel_dia * math.pi)
-    frac = steps-int(steps)
-    if frac > 0.5:
-        return int(steps + 1), 1 - frac
-    else:
-        return int(steps), -frac
+def build_phases():
+    '''
+    Build the motor directions and motion profile from the calibration.
+    Called at import; call it again after changing calibration.
+    '''
+    global _directions
 
+    _directions = motion_directions(calibration.invert_direction)
+    build_ramp(calibration.cruise_delay)
 
-def forward(distance):
-    global _x, _y, _heading
-    steps, frac = step(distance)
-    if DEBUG:
-        print("%sforward(%s)" % (spacer, distance))
-
-    for x in range(steps):
-        for pattern in range(len(patterns)):
-            for bit in range(len(patterns[pattern])):  # fwd_mask[num]:
-                if not calibration.invert_direction:
-                    L_stepper[bit].value = patterns[pattern][bit]
-                    R_stepper[bit].value = patterns[::-1][pattern][bit]
-                else:
-                    R_stepper[bit].value = patterns[pattern][bit]
-                    L_stepper[bit].value = patterns[::-1][pattern][bit]
-            time.sleep(calibration.delay_time/1000)
 
-    # new point
-    deltax = distance * math.cos(math.radians(_heading))
-    deltay = distance * math.sin(math.radians(_heading))
-    _x = _x + deltax
-    _y = _y + deltay
+def set_step_mode(mode):
+    '''
+    Drive the steppers in mode, one of 'wave' (least current), 'full'
+    (most torque) or 'half' (smoothest, twice the resolution). The
+    coils are released while switching. calibration.step_mode sets the
+    mode at import. Moves already queued are taken in the old mode
+    first.
+    '''
+    global step_mode, patterns, L_bank, R_bank
+
+    flush()
+    if _queue is not None:
+        drain()
+    planner.set_mode(len(MODES[mode]))
+    power.off()
+    step_mode = mode
+    patterns = MODES[mode]
+    L_bank = StepperBank(L_stepper, patterns)
+    R_bank = StepperBank(R_stepper, patterns)
+    power.banks = (L_bank, R_bank)
+
+
+def build_ramp(cruise_delay):
+    global _cruise, _ramp
+
+    start = 1 / calibration.delay_time
+    cruise = 1 / cruise_delay
+    n = calibration.ramp_steps if cruise > start else 0
+
+    # constant acceleration: the square of the rate grows linearly
+    # with the number of steps taken
+    _ramp = tuple(int(1000000 / math.sqrt(start * start + (cruise * cruise - start * start) * i / n))
+                  for i in range(n))
+    _cruise = int(1000000 / cruise)
+
+
+def drive_arc(left_steps, right_steps):
+    # Move the L_stepper and R_stepper wheels left_steps and right_steps
+    # phases (negative to roll backward) in one move, see stepper.Move.
+    # Once start() has been called, the move is queued instead.
+    flush()
+    if not left_steps and not right_steps:
+        return
+
+    entry = (_MOVE, left_steps, right_steps, _ramp, _cruise)
+    if _queue is None:
+        run(entry)
+    else:
+        enqueue(entry)
 
 
-def backward(distance):
-    global _x, _y, _heading
-    steps, frac = step(distance)
-    if DEBUG:
-        print("%sbackward(%s)" % (spacer, distance))
-
-    for x in range(steps):
-        for pattern in range(len(patterns)):
-            for bit in range(len(patterns[pattern])):  # fwd_mask[num]:
-                if not calibration.invert_direction:
-                    R_stepper[bit].value = patterns[pattern][bit]
-                    L_stepper[bit].value = patterns[::-1][pattern][bit]
-                else:
-                    L_stepper[bit].value = patterns[pattern][bit]
-                    R_stepper[bit].value = patterns[::-1][pattern][bit]
-            time.sleep(calibration.delay_time/1000)
+# Queued motion, see start(). Entries are (_MOVE, left_steps,
+# right_steps, ramp, cruise) or (_PEN, servo angle), run in order by
+# _execute. Pen changes are queued too, so they happen between the
+# same moves as they were called between.
+_MOVE = 0
+_PEN = 1
+QUEUE_LIMIT = 8
 
-    # new point
-    deltax = distance * math.cos(math.radians(_heading - 180))
-    deltay = distance * math.sin(math.radians(_heading - 180))
-    _x = _x + deltax
-    _y = _y + deltay
+_queue = None
+_current = None # Move being taken by _execute
+_ready = None # set when entries are queued
+_idle = None # set when the queue is empty and no move is in progress
 
 
-def left(degrees):
-    global _x, _y, _heading, frac_error
-    if (degrees < 0):
-        right(-degrees)
-    else:
-        if DEBUG:
-            print("%sleft(%s)" % (spacer, degrees))
-        rotation = degrees / 360.0
-        distance = calibration.wheel_base * math.pi * rotation
-        steps, frac = step(distance)
-        frac_error += frac
-        for x in range(steps):
-            for pattern in range(len(patterns)):
-                for bit in range(len(patterns[pattern])):  # fwd_mask[num]:
-                    if not calibration.invert_direction:
-                        R_stepper[bit].value = patterns[pattern][bit]
-                        L_stepper[bit].value = patterns[pattern][bit]
-                    else:
-                        R_stepper[bit].value = patterns[::-1][pattern][bit]
-                        L_stepper[bit].value = patterns[::-1][pattern][bit]
-                time.sleep(calibration.delay_time/1000)
-        _heading = _heading + degrees
-        while _heading > 360:
-            _heading = _heading - 360
-        if False:
-            print("steps=%s, frac_error=%s" % (steps, frac_error))
-
-
-def right(degrees):
-    global _x, _y, _heading
-    if (degrees < 0):
-        left(-degrees)
-    else:
-        if DEBUG:
-            print("%sright(%s)" % (spacer, degrees))
-        rotation = degrees / 360.0
-        distance = calibration.wheel_base * math.pi * rotation
-        steps, frac = step(distance)
-        for x in range(steps):
-            for pattern in range(len(patterns)):
-                for bit in range(len(patterns[pattern])):  # fwd_mask[num]:
-                    if not calibration.invert_direction:
-                        R_stepper[bit].value = patterns[::-1][pattern][bit]
-                        L_stepper[bit].value = patterns[::-1][pattern][bit]
-                    else:
-                        R_stepper[bit].value = patterns[pattern][bit]
-                        L_stepper[bit].value = patterns[pattern][bit]
-                time.sleep(calibration.delay_time/1000)
-        _heading = _heading - degrees
-        while _heading < 0:
-            _heading = _heading + 360
-
-
-def penup():
-    servo.angle = calibration.PEN_UP
-    if DEBUG:
-        print("penup()")
+def run(entry):
+    # carry out a queue entry, blocking until it is done
+    if entry[0] == _PEN:
+        servo.angle = entry[1]
+        return
 
-def pendown():
-    servo.angle = calibration.PEN_DOWN
-    if DEBUG:
-        print("pendown()")
+    move = Move(entry[1], entry[2], _directions[FORWARD], entry[3], entry[4], len(patterns))
+    finish(move)
 
-def done():
-    for value in range(4):
-        L_stepper[value].value = False
-        R_stepper[value].value = False
-    penup()
-    time.sleep(1)
-    if DEBUG:
-        print("done()")
 
-def goto(x, y):
-    global spacer
-    spacer = '    '  # offsets debug statements after "goto(x, y)"
-    center_x, center_y = position()
-    bearing = getBearing(x, y, center_x, center_y)
-    trnRight = heading() - bearing
-    if DEBUG:
-        print("goto(%s, %s)" % (x, y))
-    if abs(trnRight) > 180:
-        if trnRight >= 0:
-            left(360 - trnRight)
-            # if DEBUG: print('left(%s)' % (360 - trnRight))
-        else:
-            right(360 + trnRight)
-            # if DEBUG: print('right(%s)' % (360 + trnRight))
-    else:
-        if trnRight >= 0:
-            right(trnRight)
-            # if DEBUG: print('right(%s)' % trnRight)
-        else:
-            left(-trnRight)
-            # if DEBUG: print('left(%s)' % -trnRight)
-    dist = distance(tuple(position()), (x, y))
-    forward(dist)
-    spacer = ''
-
-
-def setheading(to_angle):
-    '''
-    Set the orientation of the turtle to to_angle.
+def finish(move):
+    # take the rest of move, blocking until it is done
+    late = scheduler.overruns
+    power.wake()
+    scheduler.start()
+    while not move.done():
+        scheduler.wait(move.tick(L_bank, R_bank))
+    power.moved()
+    report(late)
 
-    Aliases:  setheading | seth
 
-    Argument:
-    to_angle -- a number (integer or float)
+def start():
+    '''
+    Queue motion instead of waiting for it, so that forward(), left(),
+    circle(), penup() and the like return at once. Must be called from
+    a running asyncio event loop: it creates and returns the task that
+    takes the queued moves, which run while other tasks are waiting.
+    position() and heading() are where the turtle will be once the
+    queue is empty; use wait_idle() to wait for that.
+
+    At most QUEUE_LIMIT entries are queued. Past that, callers that
+    never wait (such as the Logo interpreter) take the oldest entries
+    themselves, blocking as they used to.
+    '''
+    global asyncio, _queue, _ready, _idle
+    import asyncio
+
+    if _queue is None:
+        _queue = []
+        _ready = asyncio.Event()
+        _idle = asyncio.Event()
+        _idle.set()
+    return asyncio.create_task(_execute())
+
+
+def enqueue(entry):
+    if _queue and merge(_queue[-1], entry):
+        return
+    if len(_queue) >= QUEUE_LIMIT:
+        drain(QUEUE_LIMIT - 1)
+    _queue.append(entry)
+    _idle.clear()
+    _ready.set()
+
+
+def merge(last, entry):
+    # Extend the queued move last by entry if both turn the wheels in
+    # the same proportions and directions at the same speed, as runs of
+    # forward(1) or left(5) do, so they are taken as one move. Returns
+    # True if it did.
+    if last[0] != _MOVE or entry[0] != _MOVE or last[3] is not entry[3]:
+        return False
+    l1, r1, l2, r2 = last[1], last[2], entry[1], entry[2]
+    if l1 * r2 != l2 * r1 or l1 * l2 < 0 or r1 * r2 < 0:
+        return False
+    _queue[-1] = (_MOVE, l1 + l2, r1 + r2, last[3], last[4])
+    return True
+
+
+def drain(limit=0):
+    # block until at most limit entries are queued
+    global _current
+    if _current is not None:
+        finish(_current)
+        _current = None
+    while len(_queue) > limit:
+        run(_queue.pop(0))
+
+
+async def _execute():
+    global _current
+    while True:
+        if _current is None:
+            if not _queue:
+                _idle.set()
+                _ready.clear()
+                due = power.next()
+                if due is None:
+                    await _ready.wait()
+                else:
+                    # ease off the coils if nothing comes in time
+                    try:
+                        await asyncio.wait_for(_ready.wait(), due / 1000000000)
+                    except asyncio.TimeoutError:
+                        power.check()
+                continue
 
-    Set the orientation of the turtle to to_angle.
-    Here are some common directions in degrees:
+            entry = _queue.pop(0)
+            if entry[0] == _PEN:
+                run(entry)
+                continue
 
-     standard - mode:          logo-mode:
-    -------------------|--------------------
-       0 - east                0 - north
-      90 - north              90 - east
-     180 - west              180 - south
-     270 - south             270 - west
+            _current = Move(entry[1], entry[2], _directions[FORWARD], entry[3], entry[4],
+                            len(patterns))
+            power.wake()
+            scheduler.start()
 
-    Example:
-    >>> setheading(90)
-    >>> heading()
-    90
-    '''
+        move = _current
+        delay = scheduler.delay(move.tick(L_bank, R_bank))
+        if move.done():
+            _current = None
+            power.moved()
+        await asyncio.sleep(delay)
 
-    cur_heading = heading()
-    if (to_angle - cur_heading) < 0:
-        if (to_angle - cur_heading) > -180:
-            left(to_angle - cur_heading)
-            if DEBUG: print("Case 1 left(%s)" % (to_angle - cur_heading))
-        else:
-            left(to_angle - cur_heading + 360)
-            if DEBUG: print("Case 2 left(%s)" % (to_angle - cur_heading + 360))
-    else:
-        if (to_angle - cur_heading) > 180:
-            left(360 - to_angle - cur_heading - 180)
-            if DEBUG: print("Case 3 left(%s)" % (360 - to_angle - cur_heading))
-        else:
-            left(to_angle - cur_heading)
-            if DEBUG: print("Case 4 left(%s)" % (to_angle - cur_heading))
 
+async def wait_idle():
+    # wait until all queued motion has been carried out
+    if _queue is not None:
+        while _queue or _current is not None:
+            await _idle.wait()
 
-def pensize(size):
-    print('pensize() is not implemented in Turtle Robot')
-    pass
 
+def idle():
+    # True if no queued motion is left to carry out
+    return _queue is None or (not _queue and _current is None)
 
-def pencolor(color):
-    print('pencolor() is not implemented in Turtle Robot')
-    pass
 
+def report(late):
+    # report phases of the last move that started late
+    if DEBUG and scheduler.overruns > late:
+        print("%s%d phases late, worst by %d us" % (planner.spacer, scheduler.overruns - late,
+                                                   scheduler.worst // 1000))
 
-def speed(x):
-    print('speed() is not implemented in Turtle Robot')
-    pass
 
-def shape(x):
-    print('shape() is not implemented in Turtle Robot')
-    pass
 
+servo = adafruit_motor.servo.Servo(pwm, min_pulse=calibration.min_pulse,
+                                   max_pulse=calibration.max_pulse)
 
-def position():
-    return _x, _y
+build_phases()
 
 
-def heading():
-    return _heading
 
+def setDebug(val):
+    global DEBUG
+    DEBUG = val
+    planner.debug = val
 
-def distance(pointA, pointB):
-    return abs((pointB[0] - pointA[0])**2 + (pointB[1] - pointA[1])**2)**0.5
 
+def pen(down):
+    # move the pen servo, after the moves queued so far
+    angle = calibration.PEN_DOWN if down else calibration.PEN_UP
+    if _queue is None:
+        servo.angle = angle
+        power.check()
+    else:
+        enqueue((_PEN, angle))
 
-def getBearing2(x, y, center_x, center_y):
-    angle = math.degrees(math.atan2(y - center_y, x - center_x))
-    return 90 - angle
+def done():
+    flush()
+    if _queue is not None:
+        drain()
+    power.off()
+    penup()
+    if _queue is not None:
+        drain()
+    time.sleep(1)
+    if DEBUG:
+        print("done()")
 
-def getBearing(x, y, center_x, center_y):
-    # https://stackoverflow.com/questions/5058617/bearing-between-two-points
-    angle = math.degrees(math.atan2(y - center_y, x - center_x))
-    bearing = (angle + 360) % 360
-    return bearing
+def pensize(size):
+    print('pensize() is not implemented in Turtle Robot')
+    pass
 
 
-def circle(radius, extent=None, steps=None):
-    """ Draw a circle with given radius.
+def pencolor(color):
+    print('pencolor() is not implemented in Turtle Robot')
+    pass
 
-    Arguments:
-    radius -- a number
-    extent (optional) -- a number
-    steps (optional) -- an integer
 
-    Draw a circle with given radius. The center is radius units left
-    of the turtle; extent - an angle - determines which part of the
-    circle is drawn. If extent is not given, draw the entire circle.
-    If extent is not a full circle, one endpoint of the arc is the
-    current pen position. Draw the arc in counterclockwise direction
-    if radius is positive, otherwise in clockwise direction. Finally
-    the direction of the turtle is changed by the amount of extent.
+def pace(speed):
+    # build the motion profile of speed(speed)
+    slowest = calibration.delay_time
+    fastest = calibration.min_delay
+    if speed == 0:
+        build_ramp(fastest)
+    else:
+        build_ramp(slowest - (slowest - fastest) * (speed - 1) / 10)
+
+
+# Turtle commands. They are planned into wheel moves the same way as on
+# the host, see planner.Planner, which drives them through drive_arc()
+# and moves the pen through pen().
+planner = Planner(len(patterns), drive_arc, pen, pace)
+step = planner.step
+phases = planner.phases
+lookahead = planner.lookahead
+flush = planner.flush
+drive = planner.drive
+forward = planner.forward
+backward = planner.backward
+left = planner.left
+right = planner.right
+penup = planner.penup
+pendown = planner.pendown
+isdown = planner.isdown
+speed = planner.speed
+reversing = planner.reversing
+goto = planner.goto
+setheading = planner.setheading
+position = planner.position
+heading = planner.heading
+circle = planner.circle
+arc = planner.arc
 
-    As the circle is approximated by an inscribed regular polygon,
-    steps determines the number of steps to use. If not given,
-    it will be calculated automatically. Maybe used to draw regular
-    polygons.
 
-    call: circle(radius)                  # full circle
-    --or: circle(radius, extent)          # arc
-    --or: circle(radius, extent, steps)
-    --or: circle(radius, steps=6)         # 6-sided polygon
+def shape(x):
+    print('shape() is not implemented in Turtle Robot')
+    pass
 
-    Example (for a Turtle instance named turtle):
-    >>> turtle.circle(50)
-    >>> turtle.circle(120, 180)  # semicircle
-    """
 
-    if extent is None:
-        extent = 360
-    if steps is None:
-        frac = abs(extent)/360
-        # print("frac = %s" % frac)
-        steps = 1+int(min(11+abs(radius)/6.0, 59.0)*frac)
-    w = 1.0 * extent / steps
-    w2 = 0.5 * w
-    length = 2.0 * radius * math.sin(w2*math.pi/180.0)
-    if radius < 0:
-        length, w, w2 = -length, -w, -w2
-    if DEBUG:
-        print("circle(%s, extent=%s, steps=%s)" % (radius, extent, steps))
-    if False:
-        print("length (step length) = %s" % length)
-        print("w (turn angle)= %s" % w)		
-        print("w2 (inital rotation) = %s" % w2)
-
-        print("steps = %s" % steps)	
-        print("extent = %s" % extent)
-        # print("self._degreesPerAU = %s" % self._degreesPerAU)
-    left(w2)
-    for i in range(steps):
-        forward(length)
-        left(w)
-    left(-w2)
+def pause(seconds):
+    '''
+    Wait for seconds with the motors idle, holding and then releasing
+    the coils when calibration.hold_time and release_time come up.
+    Programs that wait, such as for the Logo WAIT primitive, should use
+    this rather than time.sleep().
+    '''
+    flush()
+    if _queue is not None:
+        drain()
+    end = time.monotonic_ns() + int(seconds * 1000000000)
+    while True:
+        now = time.monotonic_ns()
+        due = power.next()
+        if due is None or now + due >= end:
+            break
+        time.sleep(due / 1000000000)
+        power.check()
+    if end > now:
+        time.sleep((end - now) / 1000000000)
+    power.check()
+
+
+def energised_time():
+    # seconds the coils have spent fully energised and held on one coil
+    energised, holding = power.totals()
+    return energised / 1000000000, holding / 1000000000
 
 
 def isButtonPushed():
+    flush()
+    power.check()
     return not button.value #pulled up (True) when not pushed
 
 def tone(frequency, duration):
     ''' Plays a single note of frequency (hz)
         and duration (seconds). '''
+    flush()
+    power.check()
     simpleio.tone(PIEZO_PIN, frequency, duration=duration)
@@ -10,7 +10,8 @@
 # This is a reimplementation of logo.js in Python since it still uses
 # the Logo interface. Error checking is minimal in this version since
 # it assumes the code it will run has already been executed
-# successfully.
+# successfully. With checked=False, even those checks are only made
+# once, by parsing the whole program before it is run (see verify).
 #
 # The original copyright for that code written in JavaScript is:
 #
@@ -35,43 +36,191 @@ import random
 NUMBER = re.compile("-?([0-9]*\\.?[0-9]+([eE][\\-+]?[0-9]+)?)")
 UNARY_MINUS = '<UNARYMINUS>'
 
-class StringMap:
-    def __init__(self, case_fold):
-        self._case_fold = case_fold
-        self._map = {}
-
-    def get(self, key):
-        key = key if not self._case_fold else key.lower()
-        return self._map.get(key, None)
-
-    def set(self, key, value):
-        key = key if not self._case_fold else key.lower()
-        self._map[key] = value
-
-    def has(self, key):
-        key = key if not self._case_fold else key.lower()
-        return key in self._map
-
-    def delete(self, key):
-        key = key if not self._case_fold else key.lower()
-        del self._map[key]
-
-    def keys(self):
-        return self.keys()
-
-    def empty(self):
-        return len(self._map) == 0
-
-    # forEach
+# token classes, see Logo.classify
+TOKEN_NUMBER = 0
+TOKEN_QUOTED = 1
+TOKEN_VARIABLE = 2
+TOKEN_PROCEDURE = 3
+TOKEN_DELIMITER = 4
+TOKEN_LIST = 5
+
+class Symbol:
+    # An interned, case-folded word. A symbol carries the routine and
+    # the variable of that name, so neither needs a table lookup once a
+    # token has been interned.
+    #
+    # Variables are shallow-bound: value holds the innermost binding and
+    # depth the index of the scope that made it (-1 when unbound). The
+    # bindings it shadows are kept by that scope until it exits, so
+    # reading or setting a variable never searches the scopes.
+
+    def __init__(self, name):
+        self.name = name
+        self.routine = None
+        self.io = None # set by setvar once the turtle has been asked
+        self.value = None
+        self.depth = -1
+
+class SymbolTable:
+    def __init__(self):
+        self._folded = {} # case-folded name -> Symbol
+        self._words = {} # word as written -> Symbol
+
+    def find(self, word):
+        sym = self._words.get(word)
+        if sym is None:
+            sym = self._folded.get(word.lower())
+            if sym is not None:
+                self._words[word] = sym
+
+        return sym
+
+    def intern(self, word):
+        sym = self.find(word)
+        if sym is None:
+            name = word.lower()
+            sym = Symbol(name)
+            self._folded[name] = sym
+            self._words[word] = sym
+
+        return sym
+
+class Scope:
+    # Scopes are pooled (see Logo.pushScope), so the bindings to restore
+    # are kept in slot lists that are reused rather than reallocated:
+    # the first n entries of bound, values and depths are in use.
+
+    def __init__(self):
+        self.bound = [] # variables to restore when this scope exits
+        self.values = []
+        self.depths = []
+        self.n = 0
+
+    def save(self, var):
+        n = self.n
+        if n < len(self.bound):
+            self.bound[n] = var
+            self.values[n] = var.value
+            self.depths[n] = var.depth
+        else:
+            self.bound.append(var)
+            self.values.append(var.value)
+            self.depths.append(var.depth)
+
+        self.n = n + 1
+
+    def restore(self):
+        n = self.n
+        while n > 0:
+            n -= 1
+            var = self.bound[n]
+            var.value = self.values[n]
+            var.depth = self.depths[n]
+            self.bound[n] = self.values[n] = None
+
+        self.n = 0
+        if hasattr(self, '_test'): del self._test
+
+class TokenStream:
+    # A read cursor over a list of tokens. Parsing consumes tokens by
+    # advancing the cursor, so the list is never copied or modified.
+    # len() and indexing are relative to the cursor.
+
+    def __init__(self, tokens, pos = 0):
+        self.tokens = tokens
+        self.pos = pos
+
+    def __len__(self):
+        return len(self.tokens) - self.pos
+
+    def __getitem__(self, i):
+        return self.tokens[self.pos + i]
+
+    def next(self):
+        atom = self.tokens[self.pos]
+        self.pos += 1
+        return atom
+
+# statement kinds in Block.code
+OP_EVAL = 0 # (OP_EVAL, thunk)
+OP_ENTER = 1 # (OP_ENTER, enter, args, noeval), see Logo.runFrames
+OP_CALL = 2 # (OP_CALL, call, args, tail), a call to a procedure, tail
+            # is True if it is the last statement of its block
+
+# most frames and scopes kept for reuse
+FRAME_POOL = 16
+SCOPE_POOL = 16
+# most compiled blocks kept. Lists built while running (MAKE copies
+# them) are compiled as well, so without a bound a loop that runs new
+# lists would fill the heap.
+BLOCK_CACHE = 64
+
+class Block:
+    # A list of statements compiled to ops. Ops are recorded as each
+    # statement is parsed and run for the first time, so parsing still
+    # sees the routine table exactly as it was when the original
+    # interpreter reached that statement. A block is only reused when it
+    # was parsed from its start to its end without the routine table
+    # changing.
+
+    def __init__(self, statements, generation, start = 0):
+        self.statements = statements # keeps id(statements) valid
+        self.generation = generation
+        self.start = start
+        self.cache = start == 0
+        self.code = []
+        self.ends = [] # offset of the token after each statement
+
+class Frame:
+    # A block being run by Logo.runFrames. tokens is set while the
+    # block is still being parsed. resume is called when the block has
+    # run to its end and returns True if it restarted the block (the
+    # next iteration of a loop). Frames are pooled, and slots holds the
+    # inputs of a procedure call while they are evaluated.
+
+    def __init__(self):
+        self.resume = None
+        self.returnResult = False
+        self.result = None
+        self.block = None
+        self.tokens = None
+        self.pc = 0
+        self.slots = []
 
 class Logo:
-    def __init__(self, turtle):
+    def __init__(self, turtle, checked = True):
         self.turtle = turtle
-        self.routines = StringMap(True)
-        self.scopes = [StringMap(True)]
+        self.checked = checked
+        self.symbols = SymbolTable()
+        self.scopes = [Scope()]
+        self._scopePool = []
 
         self.stack = []
+        self.frames = []
+        self._framePool = []
+        self._result = None # result of the last statement run
+        self._call = None # last call parsed, see statement()
+        self._const = None # last constant parsed, see constantOf()
         self._repcount = 0
+
+        # (class, value) of every string word parsed so far
+        self._classes = {}
+        # compiled blocks, keyed by id() of the statement list
+        self._blocks = {}
+        # bumped on every change to a routine to invalidate _blocks
+        self._generation = 0
+        # blocks left to parse during verify()
+        self._verifying = None
+
+        if not checked:
+            # programs are verified by run(), so skip the checks made on
+            # every value while running
+            self.aexpr = self.aexprUnchecked
+            self.lexpr = self.lexprUnchecked
+            self.checkblock = self.checkblockUnchecked
+            self.truth = self.truthUnchecked
+
+        self.define_operators()
         self.define_motion()
         self.define_control()
         self.define_misc()
@@ -80,32 +229,65 @@ class Logo:
         self.define_wk()
 
     def isKeyword(self, atom, match):
-        if not self.Type(atom) == 'word':
+        if not isinstance(atom, str):
             return False
 
-        atom = str(atom).upper()
-
         # TODO: keywordAliases
 
-        return atom == match
+        match = self.symbols.intern(match)
+        return self.symbols.find(atom) is match
 
-    def defer(self, func, *args):
-        def deferred():
-            a = [aa() for aa in args]
-            return func(*a)
-
-        return deferred
+    def routine(self, name):
+        sym = self.symbols.find(name)
+        return sym.routine if sym is not None else None
 
     def run(self, code):
-        return self.execute(code)
+        if not self.checked:
+            self.verify(code)
+
+        base = len(self.frames)
+        frame = self.pushFrame(code, None, False)
+        # top-level code runs once, so don't keep it compiled
+        frame.block.cache = False
+        return self.runFrames(base)
+
+    def verify(self, code):
+        # Parses code, the procedures it defines and the blocks of the
+        # control structures it uses, without running any of it. Errors
+        # are reported as they would be when running.
+        pending = [code]
+        self._verifying = pending
+        try:
+            while pending:
+                tokens = TokenStream(pending.pop())
+                while len(tokens):
+                    self.expression(tokens)
+        finally:
+            self._verifying = None
+
+    def invalidate(self):
+        # parsing depends on the arity of routines and call sites hold
+        # on to the routine they resolved, so any change to the routine
+        # table makes all compiled blocks stale.
+        self._generation += 1
+        self._blocks = {}
 
     def define(self, names, code, nargs, props = None):
         if props is None: props = {}
 
         props['args'] = nargs
+        # built in, so TO cannot redefine it
+        props['primitive'] = True
+
+        if props.get('frame', False):
+            # code pushes frames for runFrames instead of running them
+            props['enter'] = code
+            code = self.frameRunner(code)
 
         for n in names:
-            self.routines.set(n, {'code': code, 'props': props})
+            self.symbols.intern(n).routine = {'code': code, 'props': props}
+
+        self.invalidate()
 
     # transmitters
 
@@ -148,6 +330,9 @@ class Logo:
     def setheading(self, heading):
         self.turtle.setheading(self.aexpr(heading))
 
+    def speed(self, s):
+        self.turtle.speed(self.aexpr(s))
+
     def home(self):
         # TODO
         return self.turtle.home()
@@ -220,10 +405,11 @@ class Logo:
         self.define(['right', 'rt'], self.right, 1)
 
         self.define(['setpos'], self.setpos, 1)
-        self.define(['setxy'], self.setxy, 1)
+        self.define(['setxy'], self.setxy, 2)
         self.define(['setx'], self.setx, 1)
         self.define(['sety'], self.sety, 1)
         self.define(['setheading', 'seth'], self.setheading, 1)
+        self.define(['speed', 'setspeed'], self.speed, 1)
 
         self.define(['home'], self.home, 0)
         self.define(['arc'], self.arc, 2)
@@ -245,100 +431,129 @@ class Logo:
         self.define(['rightsensor'], self.rightsensor, 0)
 
     # control
+
+    # The control structures below push frames for runFrames to run
+    # rather than running their blocks themselves, so that Logo code
+    # nested in them does not nest Python calls.
+
     def repeat(self, count, statements):
         count = self.aexpr(count)
-        statements = self.lexpr(statements)
-        old_repcount = self._repcount
-        i = 1
+        statements = self.checkblock(statements)
+
+        if not (1 > count):
+            frame = self.pushFrame(statements, self.resumeRepeat)
+            frame.count = count
+            frame.i = 1
+            frame.old_repcount = self._repcount
 
-        while not (i > count):
-            self.execute(statements)
-            i += 1
-            self._repcount = i
+    def resumeRepeat(self, frame):
+        frame.i += 1
+        self._repcount = frame.i
 
-        self._repcount = old_repcount
+        if not (frame.i > frame.count):
+            return self.restartFrame(frame)
+
+        self._repcount = frame.old_repcount
+        return False
 
     def repcount(self):
         return self._repcount
 
     def forever(self, statements):
-        statements = self.lexpr(statements)
-        old_repcount = self._repcount
-        i = 1
+        statements = self.checkblock(statements)
+        frame = self.pushFrame(statements, self.resumeForever)
+        frame.i = 1
 
-        while True:
-            self.execute(statements)
-            i += 1
-            self._repcount = i
-
-        self._repcount = old_repcount
+    def resumeForever(self, frame):
+        frame.i += 1
+        self._repcount = frame.i
+        return self.restartFrame(frame)
 
     def if_(self, tf, statements, *args):
-        if self.Type(tf) == 'list':
-            tf = self.evaluateExpression(tf)
+        tf = self.truth(tf)
 
         statements2 = args # unsure when this triggers?
         tf = self.aexpr(tf)
-        if not statements2:
-            return self.execute(statements, {'returnResult': True}) if tf else None
-        else:
-            return self.execute(statements, {'returnResult': True}) if tf else self.execute(statements2, {'returnResult': True})
+        if tf:
+            self.pushFrame(self.checkblock(statements), None, True)
+        elif statements2:
+            self.pushFrame(self.checkblock(statements2[0]), None, True)
 
     def ifelse(self, tf, statements1, statements2):
-        if self.Type(tf) == 'list':
-            tf = self.evaluateExpression(tf)
+        tf = self.truth(tf)
 
-        return self.execute(statements1, {'returnResult': True}) if tf else self.execute(statements2, {'returnResult': True})
+        self.pushFrame(self.checkblock(statements1 if tf else statements2), None, True)
 
-    def checkevalblock(self, block):
-        block = block()
+    def checkblock(self, block):
+        # blocks are run in place (not copied) so their compiled form
+        # can be found again on the next iteration
         assert self.Type(block) == 'list'
         return block
 
+    def checkevalblock(self, block):
+        return self.checkblock(block())
+
+    def truth(self, tf):
+        if self.Type(tf) == 'list':
+            tf = self.execute(tf, {'returnResult': True})
+
+        return tf
+
+    def checkblockUnchecked(self, block):
+        return block
+
+    def truthUnchecked(self, tf):
+        if isinstance(tf, list):
+            tf = self.execute(tf, {'returnResult': True})
+
+        return tf
+
     def while_(self, tfexpression, block):
         block = self.checkevalblock(block)
 
-        tf = tfexpression()
-        if self.Type(tf) == 'list':
-            tf = self.evaluateExpression(tf)
+        if self.truth(tfexpression()):
+            frame = self.pushFrame(block, self.resumeWhile)
+            frame.tfexpression = tfexpression
 
-        while tf:
-            self.execute(block)
-            tf = tfexpression()
-            if self.Type(tf) == 'list':
-                tf = self.evaluateExpression(tf)
+    def resumeWhile(self, frame):
+        if self.truth(frame.tfexpression()):
+            return self.restartFrame(frame)
+
+        return False
+
+    def resumeUntil(self, frame):
+        if not self.truth(frame.tfexpression()):
+            return self.restartFrame(frame)
+
+        return False
 
     def test(self, tf):
-        if self.Type(tf) == 'list':
-            tf = self.evaluateExpression(tf)
+        tf = self.truth(tf)
 
         tf = self.aexpr(tf)
         self.scopes[-1]._test = tf
 
     def iftrue(self, statements):
-        statements = self.lexpr(statements)
+        statements = self.checkblock(statements)
         assert hasattr(self.scopes[len(self.scopes) - 1], '_test'), "test must be called first"
 
         tf = self.scopes[-1]._test
 
-        if tf: return self.execute(statements, {'returnResult': True})
+        if tf: self.pushFrame(statements, None, True)
 
     def iffalse(self, statements):
-        statements = self.lexpr(statements)
+        statements = self.checkblock(statements)
         assert hasattr(self.scopes[len(self.scopes) - 1], '_test'), "test must be called first"
 
         tf = self.scopes[-1]._test
 
-        if not tf: return self.execute(statements, {'returnResult': True})
+        if not tf: self.pushFrame(statements, None, True)
 
     def for_(self, control, statements):
-        control = self.lexpr(control)
-        statements = self.lexpr(statements)
+        control = TokenStream(self.lexpr(control))
+        statements = self.checkblock(statements)
 
-        def sign(x):
-            return -1 if x < 0 else 1 if x > 0 else 0
-
-        varname = self.sexpr(control.pop(0))
+        var = self.variable(self.sexpr(control.next()))
 
         current = start = self.aexpr(self.evaluateExpression(control))
         limit = self.aexpr(self.evaluateExpression(control))
@@ -348,60 +563,72 @@ class Logo:
         else:
             step = -1 if limit < start else 1
 
-        while not sign(current - limit) == sign(step):
-            self.setlocal(varname, current)
-            self.execute(statements)
-            current += step
+        if not self.sign(current - limit) == self.sign(step):
+            self.bind(var, current)
+            frame = self.pushFrame(statements, self.resumeFor)
+            frame.var = var
+            frame.current = current
+            frame.limit = limit
+            frame.step = step
+
+    def sign(self, x):
+        return -1 if x < 0 else 1 if x > 0 else 0
+
+    def resumeFor(self, frame):
+        frame.current += frame.step
+
+        if not self.sign(frame.current - frame.limit) == self.sign(frame.step):
+            self.bind(frame.var, frame.current)
+            return self.restartFrame(frame)
+
+        return False
 
     def dotimes(self, control, statements):
-        control = self.lexpr(control)
-        statements = self.lexpr(statements)
+        control = TokenStream(self.lexpr(control))
+        statements = self.checkblock(statements)
 
-        varname = self.sexpr(control.pop(0))
-        current = 1
+        var = self.variable(self.sexpr(control.next()))
 
         times = self.aexpr(self.evaluateExpression(control))
-        while not (current > times):
-            self.setlocal(varname, current)
-            self.execute(statements)
-            current += 1
+        if not (1 > times):
+            self.bind(var, 1)
+            frame = self.pushFrame(statements, self.resumeDotimes)
+            frame.var = var
+            frame.current = 1
+            frame.times = times
+
+    def resumeDotimes(self, frame):
+        frame.current += 1
+
+        if not (frame.current > frame.times):
+            self.bind(frame.var, frame.current)
+            return self.restartFrame(frame)
+
+        return False
 
     def do_while(self, block, tfexpression):
         block = self.checkevalblock(block)
-        tf = True
-        while tf:
-            self.execute(block)
-            tf = tfexpression()
-            if self.Type(tf) == 'list':
-                tf = self.evaluateExpression(tf)
+        frame = self.pushFrame(block, self.resumeWhile)
+        frame.tfexpression = tfexpression
 
     def do_until(self, block, tfexpression):
         block = self.checkevalblock(block)
-        tf = False
-        while not tf:
-            self.execute(block)
-            tf = tfexpression()
-            if self.Type(tf) == 'list':
-                tf = self.evaluateExpression(tf)
+        frame = self.pushFrame(block, self.resumeUntil)
+        frame.tfexpression = tfexpression
 
     def until(self, tfexpression, block):
         block = self.checkevalblock(block)
-        tf = tfexpression()
-        if self.Type(tf) == 'list':
-            tf = self.evaluateExpression(tf)
 
-        while not tf:
-            self.execute(block)
-            tf = tfexpression()
-            if self.Type(tf) == 'list':
-                tf = self.evaluateExpression(tf)
+        if not self.truth(tfexpression()):
+            frame = self.pushFrame(block, self.resumeUntil)
+            frame.tfexpression = tfexpression
 
     def case(self, value, clauses):
         clauses = self.lexpr(clauses)
 
         for clause in clauses:
-            clause = self.lexpr(clause)
-            first = clause.pop(0)
+            clause = TokenStream(self.lexpr(clause))
+            first = clause.next()
 
             if self.isKeyword(first, 'ELSE'):
                 return self.evaluateExpression(clause)
@@ -421,71 +648,99 @@ class Logo:
         clauses = self.lexpr(clauses)
 
         for clause in clauses:
-            clause = self.lexpr(clause)
-            first = clause.pop(0)
+            clause = TokenStream(self.lexpr(clause))
+            first = clause.next()
             if self.isKeyword(first, 'ELSE'):
                 return self.evaluateExpression(clause)
 
-            result = self.evaluateExpression(self.lexpr(first))
+            result = self.evaluateExpression(TokenStream(self.lexpr(first)))
             if result:
                 return self.evaluateExpression(clause)
 
     def define_control(self):
         # TODO: run, runresult
-        self.define(['repeat'], self.repeat, 2)
-        self.define(['forever'], self.forever, 1)
+        # blocks lists the inputs that are run as code, for verify()
+        self.define(['repeat'], self.repeat, 2, {'frame': True, 'blocks': (1,)})
+        self.define(['forever'], self.forever, 1, {'frame': True, 'blocks': (0,)})
         self.define(['repcount', '#'], self.repcount, 0)
-        self.define(['if'], self.if_, 2, {'maximum': 3})
-        self.define(['ifelse'], self.ifelse, 3)
-        self.define(['while'], self.while_, 2, {'noeval': True})
-        self.define(['test'], self.test, 1)
-        self.define(['iftrue', 'ift'], self.iftrue, 1)
-        self.define(['iffalse', 'iff'], self.iffalse, 1)
-        self.define(['for'], self.for_, 2)
-        self.define(['dotimes'], self.dotimes, 2)
-        self.define(['do.while'], self.do_while, 2, {'noeval': True})
-        self.define(['do.until'], self.do_until, 2, {'noeval': True})
-        self.define(['until'], self.until, 2, {'noeval': True})
+        self.define(['if'], self.if_, 2, {'maximum': 3, 'frame': True, 'blocks': (0, 1, 2)})
+        self.define(['ifelse'], self.ifelse, 3, {'frame': True, 'blocks': (0, 1, 2)})
+        self.define(['while'], self.while_, 2, {'noeval': True, 'frame': True, 'blocks': (0, 1)})
+        self.define(['test'], self.test, 1, {'blocks': (0,)})
+        self.define(['iftrue', 'ift'], self.iftrue, 1, {'frame': True, 'blocks': (0,)})
+        self.define(['iffalse', 'iff'], self.iffalse, 1, {'frame': True, 'blocks': (0,)})
+        self.define(['for'], self.for_, 2, {'frame': True, 'blocks': (1,)})
+        self.define(['dotimes'], self.dotimes, 2, {'frame': True, 'blocks': (1,)})
+        self.define(['do.while'], self.do_while, 2, {'noeval': True, 'frame': True, 'blocks': (0, 1)})
+        self.define(['do.until'], self.do_until, 2, {'noeval': True, 'frame': True, 'blocks': (0, 1)})
+        self.define(['until'], self.until, 2, {'noeval': True, 'frame': True, 'blocks': (0, 1)})
         self.define(['case'], self.case, 2)
         self.define(['cond'], self.cond, 1)
 
     # variables
+    def variable(self, name):
+        # symbols are never removed, so callers may hold on to them
+        return self.symbols.intern(name)
+
     def lvalue(self, name):
-        for i in range(len(self.scopes) - 1, -1, -1):
-            if self.scopes[i].has(name):
-                return self.scopes[i].get(name)
+        var = self.symbols.find(name)
+        if var is not None and var.depth >= 0:
+            return var
 
     def maybegetvar(self, name):
         lval = self.lvalue(name)
-        return lval['value'] if lval else None
+        return lval.value if lval else None
 
     def getvar(self, name):
         value = self.maybegetvar(name)
         assert value is not None
         return value
 
+    def getvalue(self, var):
+        value = var.value
+        assert value is not None
+        return value
+
     def setvar(self, name, value):
         value = self.copy(value)
-        lval = self.lvalue(name)
-        if lval:
-            lval['value'] = value
-        else:
-            lval = {'value': value}
-            self.scopes[0].set(name, lval)
+        var = self.variable(name)
+        if var.depth < 0:
+            var.depth = 0 # global
+
+        var.value = value
 
         # this won't respect scope!
-        if self.turtle.is_io_var(name):
+        if var.io is None:
+            var.io = self.turtle.is_io_var(name)
+
+        if var.io:
             self.turtle.setvar(name, value)
 
+    def bind(self, var, value):
+        # make value the binding of var in the innermost scope
+        depth = len(self.scopes) - 1
+        if var.depth != depth and depth > 0:
+            self.scopes[-1].save(var)
+
+        var.depth = depth
+        var.value = value
+
+    def pushScope(self):
+        pool = self._scopePool
+        self.scopes.append(pool.pop() if pool else Scope())
+
+    def popScope(self):
+        scope = self.scopes.pop()
+        scope.restore()
+        if len(self._scopePool) < SCOPE_POOL:
+            self._scopePool.append(scope)
 
     def local(self, name):
-        scope = self.scopes[-1]
-        scope.set(self.sexpr(name), {'value': None})
+        self.bind(self.variable(self.sexpr(name)), None)
 
     def setlocal(self, name, value):
         value = self.copy(value)
-        scope = self.scopes[-1]
-        scope.set(self.sexpr(name), {'value': value})
+        self.bind(self.variable(self.sexpr(name)), value)
 
     def make(self, varname, value):
         sv = self.sexpr(varname)
@@ -578,7 +833,7 @@ class Logo:
     # Type
 
     def to(self, list_):
-        name = self.sexpr(list_.pop(0))
+        name = self.sexpr(list_.next())
         if self.isNumber(name) or self.isOperator(name):
             assert False, "TO: identifier needed for procedure name"
 
@@ -598,21 +853,22 @@ class Logo:
         sawEnd = False
 
         while len(list_):
-            atom = list_.pop(0)
+            atom = list_.next()
             if self.isKeyword(atom, 'END'):
                 sawEnd = True
                 break
 
+            tag, value = self.classify(atom)
+
             if state == REQUIRED:
-                if self.Type(atom) == 'word' and str(atom)[0] == ':':
+                if tag == TOKEN_VARIABLE:
                     inputs.append(atom[1:])
                     continue
                 state = OPTIONAL
 
             if state == OPTIONAL:
                 if self.Type(atom) == 'list' and len(atom) > 1 and str(atom[0])[0] == ':':
-                    n = atom.pop(0)[1:]
-                    optional_inputs.append([n, atom])
+                    optional_inputs.append([atom[0][1:], atom[1:]])
                     continue
                 state = REST
 
@@ -624,8 +880,8 @@ class Logo:
 
             if state == DEFAULT:
                 state = BLOCK
-                if self.Type(atom) == 'word' and self.isNumber(atom):
-                    length = self.parseFloat(atom) # TODO
+                if tag == TOKEN_NUMBER:
+                    length = value
                     continue
 
             block.append(atom)
@@ -635,7 +891,8 @@ class Logo:
         self.defineProc(name, inputs, optional_inputs, rest, length, block)
 
     def defineProc(self, name, inputs, optional_inputs, rest, def_, block):
-        if self.routines.has(name) and self.routines.get(name)['proc'].get('primitive', False):
+        proc = self.routine(name)
+        if proc is not None and proc['props'].get('primitive', False):
             assert False, "Can't redefine primitive"
 
         if def_ is not None:
@@ -644,37 +901,64 @@ class Logo:
 
         length = len(inputs) if def_ is None else def_
 
-        def func(*args):
-            scope = StringMap(True)
-            self.scopes.append(scope)
+        input_vars = [self.variable(n) for n in inputs]
+        optional_vars = [self.variable(op[0]) for op in optional_inputs]
+        rest_var = self.variable(rest) if rest is not None else None
 
+        def bindInputs(args, n):
             i = 0
 
-            while i < len(inputs) and i < len(args):
-                scope.set(inputs[i], {'value': args[i]})
+            while i < len(inputs) and i < n:
+                self.bind(input_vars[i], args[i])
                 i += 1
 
-            while i < len(inputs) + len(optional_inputs) and i < len(args):
-                op = optional_inputs[i - len(inputs)]
-                scope.set(op[0], {'value': args[i]})
+            while i < len(inputs) + len(optional_inputs) and i < n:
+                self.bind(optional_vars[i - len(inputs)], args[i])
+                i += 1
 
             while i < len(inputs) + len(optional_inputs):
                 op = optional_inputs[i - len(inputs)]
-                scope.set(op[0], {'value': self.evaluateExpression(op[1])})
+                self.bind(optional_vars[i - len(inputs)], self.evaluateExpression(TokenStream(op[1])))
                 i += 1
 
             if rest is not None:
-                scope.set(rest, {'value': list(args[i:])})
+                self.bind(rest_var, list(args[i:n]))
+
+        def call(frame, args, n, tail):
+            # With tail set, frame is the frame of a procedure that has
+            # nothing left to do: run in its scope instead of a new one.
+            if tail:
+                scope = self.scopes[-1]
+                if hasattr(scope, '_test'): del scope._test
+            else:
+                self.pushScope()
+
+            bindInputs(args, n)
+            self.startFrame(frame, block) # TODO: handle Output?
+            frame.result = None
+
+            if not tail:
+                self.frames.append(frame)
 
-            self.execute(block) # TODO: handle Output?
-            self.scopes.pop()
+        def enter(*args):
+            call(self.newFrame(self.resumeProc, False), args, len(args), False)
 
-        self.routines.set(name, {'code': func,
+        if self._verifying is not None:
+            self._verifying.append(block)
+
+        self.symbols.intern(name).routine = {'code': self.frameRunner(enter),
                                  'props': {'args': len(inputs),
                                            'inputs': inputs, 'optional_inputs': optional_inputs,
-                                           'rest': rest, 'def': def_, 'block': block,
+                                           'rest': rest, 'def': def_, 'block': block, 'enter': enter, 'call': call,
                                            'minimum': len(inputs), 'default': length,
-                                           'maximum': -1 if rest else len(inputs) + len(optional_inputs)}})
+                                           'maximum': -1 if rest else len(inputs) + len(optional_inputs)}}
+
+        self.invalidate()
+
+    def resumeProc(self, frame):
+        self.popScope()
+        frame.result = None
+        return False
 
     def define_wk(self):
         self.define(['to'], self.to, 1, {'special': True})
@@ -696,27 +980,234 @@ class Logo:
     def execute(self, statements, options = None):
         if options is None: options = {}
 
-        statements = list(statements) # shallow copy [.slice in original]
-
-        lastResult = None
-
-        while len(statements):
-            result = self.evaluateExpression(statements)
-
-            if result is not None and not options.get('returnResult', False):
-                print(statements, result)
+        base = len(self.frames)
+        self.pushFrame(statements, None, options.get('returnResult', False))
+        return self.runFrames(base)
+
+    def pushFrame(self, statements, resume, returnResult = False):
+        frame = self.newFrame(resume, returnResult)
+        self.startFrame(frame, statements)
+        self.frames.append(frame)
+        return frame
+
+    def newFrame(self, resume, returnResult):
+        pool = self._framePool
+        frame = pool.pop() if pool else Frame()
+        frame.resume = resume
+        frame.returnResult = returnResult
+        return frame
+
+    def freeFrame(self, frame):
+        frame.resume = frame.result = frame.block = frame.tokens = None
+        if len(self._framePool) < FRAME_POOL:
+            self._framePool.append(frame)
+
+    def startFrame(self, frame, statements):
+        block = self._blocks.get(id(statements))
+        if block is None:
+            block = Block(statements, self._generation)
+            frame.tokens = TokenStream(statements)
+        else:
+            frame.tokens = None
+
+        frame.block = block
+        frame.pc = 0
+        self._result = None
+
+    def restartFrame(self, frame):
+        # for resume functions, run the block again
+        self.startFrame(frame, frame.block.statements)
+        return True
+
+    def frameRunner(self, enter):
+        # returns a routine that runs the frames pushed by enter to
+        # completion, for calls made outside of runFrames
+        def run(*args):
+            base = len(self.frames)
+            self._result = None
+            enter(*args)
+            return self.runFrames(base)
+
+        return run
+
+    def runFrames(self, base):
+        # Runs the frames above base until they have all finished and
+        # returns the result of the last statement of the outermost.
+        # Procedure calls and control structures in statement position
+        # push a frame and return here, so the depth of Logo recursion
+        # is not limited by the Python stack.
+        frames = self.frames
+        checked = self.checked
+
+        while len(frames) > base:
+            frame = frames[-1]
+
+            # the last statement run in this frame has finished
+            result = self._result
+            if checked and result is not None and not frame.returnResult:
+                print(frame.block.statements, result)
                 assert False, "Result supplied when not wanted"
 
-            lastResult = result
+            frame.result = result
+
+            block = frame.block
+            if block.generation != self._generation:
+                # a routine was (re)defined while running this block,
+                # the rest of it must be parsed again
+                start = block.ends[frame.pc - 1] if frame.pc else block.start
+                frame.block = block = Block(block.statements, self._generation, start)
+                frame.tokens = TokenStream(block.statements, start)
+                frame.pc = 0
+
+            if frame.pc < len(block.code):
+                op = block.code[frame.pc]
+            elif frame.tokens is not None and len(frame.tokens):
+                op = self.statement(frame.tokens)
+                block.code.append(op)
+                block.ends.append(frame.tokens.pos)
+            else:
+                self.finishBlock(frame)
+
+                if frame.resume is None or not frame.resume(frame):
+                    frames.pop()
+                    self._result = frame.result
+                    self.freeFrame(frame)
+
+                continue
+
+            frame.pc += 1
+
+            if op[0] == OP_EVAL:
+                self._result = op[1]()
+            elif op[0] == OP_CALL:
+                # evaluate the inputs into the slots of the callee's
+                # frame, so the call allocates nothing once warmed up
+                callee = self.newFrame(self.resumeProc, False)
+                slots = callee.slots
+                args = op[2]
+                n = len(args)
+                while len(slots) < n:
+                    slots.append(None)
+
+                i = 0
+                while i < n:
+                    slots[i] = args[i]()
+                    i += 1
+
+                self._result = None
+
+                proc = self.tailFrame(base) if op[3] else None
+                if proc is not None:
+                    op[1](proc, slots, n, True)
+                    self.freeFrame(callee)
+                else:
+                    op[1](callee, slots, n, False)
 
-        return lastResult
+                i = 0
+                while i < n:
+                    slots[i] = None
+                    i += 1
+            else:
+                args = op[2] if op[3] else [aa() for aa in op[2]]
+                op[1](*args)
+                # a list condition tested without pushing a frame
+                # leaves its value behind
+                self._result = None
+
+        return self._result
+
+    def finishBlock(self, frame):
+        # the block of frame has been parsed to its end
+        if frame.tokens is not None and not len(frame.tokens):
+            frame.tokens = None
+            block = frame.block
+            if block.cache and block.generation == self._generation:
+                if len(self._blocks) >= BLOCK_CACHE:
+                    self._blocks = {}
+                self._blocks[id(block.statements)] = block
+
+    def atEnd(self, frame):
+        return frame.pc == len(frame.block.code) and (frame.tokens is None or not len(frame.tokens))
+
+    def tailFrame(self, base):
+        # Returns the frame of the procedure that a call in tail
+        # position returns from directly, after dropping the finished
+        # branch frames (if, ifelse, ...) in between. Returns None if
+        # that procedure still has work to do after the call.
+        frames = self.frames
+        i = len(frames) - 1
+        while i > base and frames[i].resume is None and self.atEnd(frames[i]):
+            i -= 1
+
+        frame = frames[i]
+        if frame.resume != self.resumeProc or not self.atEnd(frame):
+            return None
+
+        while len(frames) > i + 1:
+            branch = frames.pop()
+            self.finishBlock(branch)
+            self.freeFrame(branch)
+
+        self.finishBlock(frame)
+        return frame
+
+    def statement(self, l):
+        thunk = self.expression(l)
+
+        call = self._call
+        if call is not None and call[0] is thunk:
+            props = call[1]['props']
+            if 'call' in props:
+                return (OP_CALL, props['call'], call[2], not len(l))
+            if 'enter' in props:
+                return (OP_ENTER, props['enter'], call[2], props.get('noeval', False))
+
+        return (OP_EVAL, thunk)
+
+    def number(self, word):
+        # Integral words become ints and stay ints through arithmetic
+        # that allows it, so counting and step math do not go through
+        # software floating point on boards without an FPU.
+        if isinstance(word, (int, float)):
+            return word
+
+        try:
+            return int(word)
+        except (ValueError, OverflowError):
+            return float(word)
 
     def isNumber(self, atom):
-        m = NUMBER.match(str(atom))
-        if NUMBER.match(str(atom)) is not None:
-            return True
+        return NUMBER.match(str(atom)) is not None
+
+    def classify(self, atom):
+        # Returns (class, value) for a token. Each distinct word is
+        # classified once, so numbers are matched and converted, quotes
+        # and colons stripped and names interned only the first time a
+        # word is parsed.
+        if isinstance(atom, list):
+            return (TOKEN_LIST, atom)
+        if isinstance(atom, (int, float)):
+            # not memoized: 1, 1.0 and True are equal keys
+            return (TOKEN_NUMBER, atom)
+
+        cls = self._classes.get(atom)
+        if cls is None:
+            if self.isNumber(atom):
+                cls = (TOKEN_NUMBER, self.number(atom))
+            elif atom[0] == '"' or atom[0] == "'":
+                cls = (TOKEN_QUOTED, atom[1:])
+            elif atom[0] == ':':
+                cls = (TOKEN_VARIABLE, self.variable(atom[1:]))
+            elif atom[0] == '(':
+                cls = (TOKEN_DELIMITER, '(')
+            elif self.isOperator(atom) or atom == UNARY_MINUS:
+                cls = (TOKEN_DELIMITER, atom)
+            else:
+                cls = (TOKEN_PROCEDURE, self.symbols.intern(atom))
 
-        return False
+            self._classes[atom] = cls
+
+        return cls
 
     def peek(self, l, options):
         if len(l):
@@ -735,27 +1226,10 @@ class Logo:
         lhs = self.additiveExpression(l)
 
         while self.peek(l, ['=', '<', '>', '<=', '>=', '<>']):
-            op = l.pop(0)
-
-            def lhsf(lhs):
-                rhs = self.additiveExpression(l)
-
-                if op == '<':
-                    return self.defer(lambda lhs, rhs: 1 if self.aexpr(lhs) < self.aexpr(rhs) else 0, lhs, rhs)
-                elif op == '>':
-                    return self.defer(lambda lhs, rhs: 1 if self.aexpr(lhs) > self.aexpr(rhs) else 0, lhs, rhs)
-                elif op == '=':
-                    return self.defer(lambda lhs, rhs: 1 if self.equal(lhs, rhs) else 0, lhs, rhs)
-                elif op == '<=':
-                    return self.defer(lambda lhs, rhs: 1 if self.aexpr(lhs) <= self.aexpr(rhs) else 0, lhs, rhs)
-                elif op == '>=':
-                    return self.defer(lambda lhs, rhs: 1 if self.aexpr(lhs) >= self.aexpr(rhs) else 0, lhs, rhs)
-                elif op == '<>':
-                    return self.defer(lambda lhs, rhs: 1 if not self.equal(lhs, rhs) else 0, lhs, rhs)
-                else:
-                    assert False, "Internal error in relationalExpression"
-
-            lhs = lhsf(lhs)
+            op = l.next()
+            lconst = self.constantOf(lhs)
+            rhs = self.additiveExpression(l)
+            lhs = self.binary(op, lhs, lconst, rhs)
 
         return lhs
 
@@ -763,19 +1237,10 @@ class Logo:
         lhs = self.multiplicativeExpression(l)
 
         while self.peek(l, ['+', '-']):
-            op = l.pop(0)
-
-            def lhsf(lhs):
-                rhs = self.multiplicativeExpression(l)
-
-                if op == '+':
-                    return self.defer(lambda lhs, rhs: self.aexpr(lhs) + self.aexpr(rhs), lhs, rhs)
-                elif op == '-':
-                    return self.defer(lambda lhs, rhs: self.aexpr(lhs) - self.aexpr(rhs), lhs, rhs)
-                else:
-                    assert False, "Internal error in additiveExpression"
-
-            lhs = lhsf(lhs)
+            op = l.next()
+            lconst = self.constantOf(lhs)
+            rhs = self.multiplicativeExpression(l)
+            lhs = self.binary(op, lhs, lconst, rhs)
 
         return lhs
 
@@ -783,31 +1248,10 @@ class Logo:
         lhs = self.powerExpression(l)
 
         while self.peek(l, ['*', '/', '%']):
-            op = l.pop(0)
-            def lhsf(lhs):
-                rhs = self.powerExpression(l)
-                if op == '*':
-                    return self.defer(lambda lhs, rhs: self.aexpr(lhs) * self.aexpr(rhs), lhs, rhs)
-                elif op == '/':
-                    def dodiv(lhs, rhs):
-                        n = self.aexpr(lhs)
-                        d = self.aexpr(rhs)
-                        assert d != 0
-                        return n / d
-
-                    return self.defer(dodiv, lhs, rhs)
-                elif op == '%':
-                    def domod(lhs, rhs):
-                        n = self.aexpr(lhs)
-                        d = self.aexpr(rhs)
-                        assert d != 0
-                        return n % d
-
-                    return self.defer(domod, lhs, rhs)
-                else:
-                    assert False, "Internal error in multiplicativeExpression"
-
-            lhs = lhsf(lhs)
+            op = l.next()
+            lconst = self.constantOf(lhs)
+            rhs = self.powerExpression(l)
+            lhs = self.binary(op, lhs, lconst, rhs)
 
         return lhs
 
@@ -815,64 +1259,177 @@ class Logo:
         lhs = self.unaryExpression(l)
 
         while self.peek(l, ['^']):
-            op = l.pop(0)
-            def lhsf(lhs):
-                rhs = self.unaryExpression(l)
-                return self.defer(lambda lhs, rhs: math.pow(self.aexpr(lhs), self.aexpr(rhs)),
-                                  lhs, rhs)
-
-            lhs = lhsf(lhs)
+            op = l.next()
+            lconst = self.constantOf(lhs)
+            rhs = self.unaryExpression(l)
+            lhs = self.binary(op, lhs, lconst, rhs)
 
         return lhs
 
     def unaryExpression(self, l):
         if self.peek(l, [UNARY_MINUS]):
-            op = l.pop(0)
+            l.next()
             rhs = self.unaryExpression(l)
-            return self.defer(lambda rhs: -self.aexpr(rhs), rhs)
+
+            rconst = self.constantOf(rhs)
+            if rconst is not None:
+                try:
+                    return self.constant(-self.aexpr(rconst[1]))
+                except Exception:
+                    pass # leave the error to when it is run
+
+            aexpr = self.aexpr
+            return lambda: -aexpr(rhs())
         else:
             return self.finalExpression(l)
 
-    def finalExpression(self, l):
-        assert len(l), "Unexpected end of instructions"
+    def define_operators(self):
+        # infix operators: op -> (numeric, function). The inputs of
+        # numeric operators are passed through aexpr first.
+
+        # Integers stay integers unless the result is not integral. The
+        # fallbacks are for boards built without long ints, where
+        # overflowing a small int raises OverflowError.
+
+        def add(a, b):
+            try:
+                return a + b
+            except OverflowError:
+                return float(a) + float(b)
+
+        def sub(a, b):
+            try:
+                return a - b
+            except OverflowError:
+                return float(a) - float(b)
+
+        def mul(a, b):
+            try:
+                return a * b
+            except OverflowError:
+                return float(a) * float(b)
+
+        def div(n, d):
+            assert d != 0
+            if isinstance(n, int) and isinstance(d, int) and n % d == 0:
+                return n // d
+
+            return n / d
+
+        def mod(n, d):
+            assert d != 0
+            return n % d
+
+        def pow_(a, b):
+            if isinstance(a, int) and isinstance(b, int) and b >= 0:
+                try:
+                    return a ** b
+                except OverflowError:
+                    pass
+
+            return math.pow(a, b)
+
+        self.operators = {
+            '+': (True, add),
+            '-': (True, sub),
+            '*': (True, mul),
+            '/': (True, div),
+            '%': (True, mod),
+            '^': (True, pow_),
+            '<': (True, lambda a, b: 1 if a < b else 0),
+            '>': (True, lambda a, b: 1 if a > b else 0),
+            '<=': (True, lambda a, b: 1 if a <= b else 0),
+            '>=': (True, lambda a, b: 1 if a >= b else 0),
+            '=': (False, lambda a, b: 1 if self.equal(a, b) else 0),
+            '<>': (False, lambda a, b: 1 if not self.equal(a, b) else 0),
+        }
+
+    def constant(self, value):
+        # returns a thunk for value that constantOf recognizes
+        thunk = lambda: value
+        self._const = (thunk, value)
+        return thunk
+
+    def constantOf(self, thunk):
+        # (thunk, value) if thunk is the constant parsed last, else None.
+        # Operands are checked as soon as they are parsed, so the last
+        # constant is the only one that needs remembering.
+        const = self._const
+        if const is not None and const[0] is thunk:
+            return const
 
-        atom = l.pop(0)
-        ty = self.Type(atom)
+        return None
 
-        if ty == 'array' or ty == 'list':
-            return lambda: atom
-        elif ty == 'word':
-            if self.isNumber(atom):
-                return lambda: float(atom)
+    def binary(self, op, lhs, lconst, rhs):
+        # Compiles lhs op rhs. Constant operands are folded, or converted
+        # once when the other operand is not constant, so running the
+        # node needs no argument list.
+        numeric, f = self.operators[op]
+        rconst = self.constantOf(rhs)
+        conv = self.aexpr if numeric else lambda x: x
+
+        if lconst is not None and rconst is not None:
+            try:
+                return self.constant(f(conv(lconst[1]), conv(rconst[1])))
+            except Exception:
+                pass # leave the error to when it is run
+        else:
+            try:
+                if rconst is not None:
+                    b = conv(rconst[1])
+                    if numeric:
+                        aexpr = self.aexpr
+                        return lambda: f(aexpr(lhs()), b)
 
-            if atom[0] == '"' or atom[0] == "'":
-                literal = atom[1:]
-                return lambda: literal
+                    return lambda: f(lhs(), b)
 
-            if atom[0] == ':':
-                varname = atom[1:]
-                return lambda: self.getvar(varname)
+                if lconst is not None:
+                    a = conv(lconst[1])
+                    if numeric:
+                        aexpr = self.aexpr
+                        return lambda: f(a, aexpr(rhs()))
 
-            if atom[0] == '(':
-                # TODO: check for list-style procedure input calling syntax
-                if len(l) and self.Type(l[0]) == 'word' and self.routines.has(str(l[0])):
-                    if not (len(l) > 1 and self.Type(l[1]) == 'word' and self.isInfix(str(l[1]))):
-                        atom = l.pop(0)
-                        return self.dispatch(atom, l, False)
+                    return lambda: f(a, rhs())
+            except Exception:
+                pass
 
-                result = self.expression(l)
+        if numeric:
+            aexpr = self.aexpr
+            return lambda: f(aexpr(lhs()), aexpr(rhs()))
 
-                assert len(l), "Expecting ')', but list is empty"
-                assert self.peek(l, [')']), "Expecting ')', but got something else"
-                l.pop(0)
-                return result
+        return lambda: f(lhs(), rhs())
 
-            if atom == ')':
-                assert False, "Unexpected )"
+    def finalExpression(self, l):
+        assert len(l), "Unexpected end of instructions"
 
-            return self.dispatch(atom, l, True)
+        tag, value = self.classify(l.next())
+
+        if tag == TOKEN_NUMBER or tag == TOKEN_QUOTED or tag == TOKEN_LIST:
+            return self.constant(value)
+        elif tag == TOKEN_VARIABLE:
+            if not self.checked:
+                return lambda: value.value
+
+            return lambda: self.getvalue(value)
+        elif tag == TOKEN_PROCEDURE:
+            return self.dispatch(value, l, True)
+        elif value == '(':
+            # TODO: check for list-style procedure input calling syntax
+            if len(l):
+                tag, value = self.classify(l[0])
+                if tag == TOKEN_PROCEDURE and value.routine is not None:
+                    if not (len(l) > 1 and self.classify(l[1])[0] == TOKEN_DELIMITER and self.isInfix(l[1])):
+                        l.next()
+                        return self.dispatch(value, l, False)
+
+            result = self.expression(l)
+
+            assert len(l), "Expecting ')', but list is empty"
+            assert self.peek(l, [')']), "Expecting ')', but got something else"
+            l.next()
+            return result
         else:
-            assert False, "Internal error in finalExpression"
+            assert False, "Unexpected {}".format(value)
 
     def isInfix(self, word):
         return word in ['+', '-', '*', '/', '%', '^', '=', '<', '>', '<=', '>=', '<>']
@@ -881,12 +1438,14 @@ class Logo:
         return self.isInfix(word) or word in ['[', ']', '{', '}', '(', ')']
 
     def dispatch(self, name, tokenlist, natural):
-        name = name.upper()
-        proc = self.routines.get(name)
+        # name is the interned symbol of the routine
+        proc = name.routine
         if proc is None:
-            assert False, "ERROR: {} undefined".format(name)
+            assert False, "ERROR: {} undefined".format(name.name.upper())
+
+        props = proc['props']
 
-        if proc['props'].get('special', False):
+        if props.get('special', False):
             self.stack.append(name)
             proc['code'](tokenlist)
             self.stack.pop()
@@ -898,52 +1457,139 @@ class Logo:
             # note: even in the original, this formulation prevents
             # and, or, etc. from being truly short-circuiting.
 
-            for i in range(proc['props'].get('args')):
-                args.append(self.expression(tokenlist))
+            for i in range(props['args']):
+                args.append(self.argument(tokenlist, proc, i))
         else:
             while len(tokenlist) and not self.peek(tokenlist, [')']):
-                args.append(self.expression(tokenlist))
+                args.append(self.argument(tokenlist, proc, len(args)))
+
+            tokenlist.next() # )
 
-            tokenlist.pop(0) # )
+            self.checkArgs(props, len(args))
 
-            minargs = proc['props'].get('minimum', proc['props']['args'])
-            maxargs = proc['props'].get('maximum', proc['props']['args'])
+        if not self.checked:
+            return self.uncheckedCall(name, proc, args)
 
-            assert not len(args) < minargs, "Too few arguments"
-            if maxargs != -1:
-                assert not len(args) > maxargs, "Too many arguments"
+        # The call site caches the routine it resolved. A change to the
+        # routine table (see invalidate) makes compiled blocks parse
+        # again, but a call site that is still held resolves its
+        # routine again rather than run a stale one.
+        code = proc['code']
+        noeval = props.get('noeval', False)
+        gen = self._generation
+        stack = self.stack
 
-        if proc['props'].get('noeval', False):
-            def noeval():
-                self.stack.append(name)
-                rv = proc['code'](*args)
-                self.stack.pop()
+        if noeval:
+            def call():
+                nonlocal code, gen
+                if gen != self._generation:
+                    code, gen = self.resolve(name, len(args), noeval), self._generation
+
+                stack.append(name)
+                rv = code(*args)
+                stack.pop()
+                return rv
+        else:
+            def call():
+                nonlocal code, gen
+                if gen != self._generation:
+                    code, gen = self.resolve(name, len(args), noeval), self._generation
+
+                stack.append(name)
+                a = [aa() for aa in args]
+                rv = code(*a)
+                stack.pop()
                 return rv
 
-            return noeval
+        # lets statement() see that this call is a whole statement
+        self._call = (call, proc, args)
+        return call
 
-        def doeval():
-            self.stack.append(name)
-            a = [aa() for aa in args]
-            rv = proc['code'](*a)
-            self.stack.pop()
-            return rv
+    def checkArgs(self, props, n):
+        minargs = props.get('minimum', props['args'])
+        maxargs = props.get('maximum', props['args'])
+
+        assert not n < minargs, "Too few arguments"
+        if maxargs != -1:
+            assert not n > maxargs, "Too many arguments"
 
-        return doeval
+    def resolve(self, name, n, noeval):
+        # looks name up again for a call site with n inputs
+        proc = name.routine
+        if proc is None:
+            assert False, "ERROR: {} undefined".format(name.name.upper())
+
+        props = proc['props']
+        assert not props.get('special', False) and props.get('noeval', False) == noeval, \
+            "{} changed while in use".format(name.name.upper())
+        self.checkArgs(props, n)
+
+        return proc['code']
+
+    def uncheckedCall(self, name, proc, args):
+        # as the end of dispatch, but without the call stack and with
+        # the inputs of short calls evaluated without building a list
+        code = proc['code']
+        noeval = proc['props'].get('noeval', False)
+        gen = self._generation
+
+        def stale():
+            # resolve the routine again after the routine table changed
+            nonlocal code, gen
+            code, gen = self.resolve(name, len(args), noeval), self._generation
+            return code
+
+        if noeval:
+            call = lambda: (code if gen == self._generation else stale())(*args)
+        elif len(args) == 0:
+            call = lambda: (code if gen == self._generation else stale())()
+        elif len(args) == 1:
+            a0 = args[0]
+            call = lambda: (code if gen == self._generation else stale())(a0())
+        elif len(args) == 2:
+            a0, a1 = args
+            call = lambda: (code if gen == self._generation else stale())(a0(), a1())
+        else:
+            call = lambda: (code if gen == self._generation else stale())(*[aa() for aa in args])
+
+        self._call = (call, proc, args)
+        return call
+
+    def argument(self, tokenlist, proc, i):
+        # parses input i of proc, queueing it for verify() if it is a
+        # block of code
+        if self._verifying is not None and len(tokenlist) and isinstance(tokenlist[0], list):
+            if i in proc['props'].get('blocks', ()):
+                self._verifying.append(tokenlist[0])
+
+        return self.expression(tokenlist)
 
     def aexpr(self, atom):
+        if isinstance(atom, (int, float)):
+            return atom
+
         if atom is not None and self.Type(atom) == 'word':
             if self.isNumber(atom):
-                return float(atom)
+                return self.number(atom)
 
         assert False, "Expecting number"
 
+    def aexprUnchecked(self, atom):
+        if isinstance(atom, (int, float)):
+            return atom
+
+        return self.number(atom)
+
     def lexpr(self, atom):
+        # lists are only read by the parser, so they are not copied
         assert atom is not None
         if self.Type(atom) == 'word':
             raise NotImplementedError
         else:
-            return self.copy(atom)
+            return atom
+
+    def lexprUnchecked(self, atom):
+        return atom
 
     def sexpr(self, atom):
         assert atom is not None
@@ -963,7 +1609,9 @@ class Logo:
         if at != bt: return False
 
         if at == 'word':
-            if isinstance(a, (int, float)) or isinstance(b, (int, float)):
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+                return a == b
+            elif isinstance(a, (int, float)) or isinstance(b, (int, float)):
                 return float(a) == float(b)
             else:
                 return str(a) == str(b)
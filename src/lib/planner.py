@@ -0,0 +1,424 @@
+# Turtle motion planning shared by cpturtle and pyturtle.
+#
+# A Planner turns turtle commands (forward, left, goto, circle, ...)
+# into wheel moves in phases and keeps the turtle's pose. It knows
+# nothing about pins or timing: the turtle that owns it passes in
+# drive_arc, which takes a move of both wheels, pen, which raises or
+# lowers the pen, and pace, which sets the speed of later moves. The
+# turtle modules bind their commands to its methods, so the robot and
+# the host simulator plan exactly the same moves.
+
+import math
+import calibration
+from stepper import WHEELS, FORWARD, BACKWARD, LEFT, RIGHT
+
+# names accepted by speed(), as in the turtle module
+speeds = {'fastest': 0, 'fast': 10, 'normal': 6, 'slow': 3, 'slowest': 1}
+
+
+def distance(pointA, pointB):
+    return abs((pointB[0] - pointA[0])**2 + (pointB[1] - pointA[1])**2)**0.5
+
+
+def getBearing2(x, y, center_x, center_y):
+    angle = math.degrees(math.atan2(y - center_y, x - center_x))
+    return 90 - angle
+
+def getBearing(x, y, center_x, center_y):
+    # https://stackoverflow.com/questions/5058617/bearing-between-two-points
+    angle = math.degrees(math.atan2(y - center_y, x - center_x))
+    bearing = (angle + 360) % 360
+    return bearing
+
+
+class Planner:
+    # Lookahead. forward(), backward(), left() and right() hand their
+    # moves to plan() in fractions of a phase. The part that does not
+    # make a whole phase is carried into the next move of the same kind
+    # (travel or turn) instead of being rounded away on every move, and
+    # moves that come to no phases are dropped.
+    #
+    # With lookahead(True), a move is also held back until a different
+    # one comes, so that runs such as FD 1 FD 1 ... are driven as one
+    # move with one ramp instead of stopping after each. Anything else
+    # that moves the wheels or the pen, and speed(), drive the held move
+    # first; the turtle calls flush() before it reads the button, beeps,
+    # waits or is done, and programs should before reading the
+    # detectors.
+    #
+    # Odometry. The pose is worked out from the phases given to each
+    # wheel rather than from the distances asked for, so it is where the
+    # wheels take the turtle, and the rounding of moves to whole phases
+    # is carried by the planner instead of building up. The turn is kept
+    # exactly, as the integer difference between the L_stepper and
+    # R_stepper wheel travel in eighths of a pass over the patterns,
+    # which every drive mode divides.
+    #
+    # Pose planning. goto() and setheading() turn whichever way round
+    # takes the fewest phases, and goto() drives backward when the
+    # target is behind the turtle and turning away from it is shorter
+    # than turning to face it, unless reversing(False) has been called.
+
+    def __init__(self, n, drive_arc, pen=None, pace=None):
+        self.n = n # patterns of the drive mode
+        self.drive_arc = drive_arc
+        self.pen = pen
+        self.pace = pace
+
+        self.carry = [0, 0] # phases carried for travel and turns
+        self.held = None # motion of the held move, if any
+        self.held_steps = 0
+        self.ahead = False
+
+        self.x = 0
+        self.y = 0
+        self.turn = 0
+
+        self.reverse = True
+        self.down = True # pen state, down to begin with as in Logo
+        self.speed_ = None # set by speed()
+        self.debug = False
+        self.spacer = ''
+
+    def set_mode(self, n):
+        # the drive mode is changing to one with n patterns
+        self.flush()
+        self.carry[0] = self.carry[1] = 0
+        self.n = n
+
+    # phases
+
+    def step(self, distance):
+        # phases of the current drive mode to move distance mm
+        steps = distance * calibration.steps_rev * self.n / (calibration.wheel_dia * math.pi)
+        frac = steps-int(steps)
+        if frac > 0.5:
+            return int(steps + 1), 1 - frac
+        else:
+            return int(steps), -frac
+
+    def phases(self, distance):
+        # nearest number of phases for a signed distance in mm
+        steps = distance * calibration.steps_rev * self.n / (calibration.wheel_dia * math.pi)
+        return int(steps + 0.5) if steps >= 0 else -int(0.5 - steps)
+
+    # lookahead
+
+    def lookahead(self, on):
+        self.flush()
+        self.ahead = on
+
+    def plan(self, motion, distance):
+        # move distance mm (of wheel travel) in the given motion
+        kind = 0 if motion == FORWARD or motion == BACKWARD else 1
+        sign = 1 if motion == FORWARD or motion == LEFT else -1
+        total = sign * distance * calibration.steps_rev * self.n / (calibration.wheel_dia * math.pi) + self.carry[kind]
+        # the carry stays in [-0.5, 0.5), so steps never goes against sign
+        steps = math.floor(total + 0.5)
+        self.carry[kind] = total - steps
+        if steps == 0:
+            return
+
+        self.advance(steps, -steps if kind else steps)
+        steps = abs(steps)
+        if motion == self.held:
+            self.held_steps += steps
+            return
+
+        self.flush()
+        if self.ahead:
+            self.held = motion
+            self.held_steps = steps
+        else:
+            self.drive(motion, steps)
+
+    def flush(self):
+        # drive the held move, if any
+        if self.held is not None:
+            motion = self.held
+            self.held = None
+            self.drive(motion, self.held_steps)
+
+    def drive(self, motion, steps):
+        # step both motors steps phases in the given motion
+        left, right = WHEELS[motion]
+        self.drive_arc(left * steps, right * steps)
+
+    # odometry
+
+    def eighth(self):
+        # wheel travel in mm of an eighth of a pass over the patterns
+        return calibration.wheel_dia * math.pi / (calibration.steps_rev * 8)
+
+    def advance(self, left_steps, right_steps):
+        # Update the pose for a move of the L_stepper and R_stepper
+        # wheels by left_steps and right_steps phases. The turtle moves
+        # along an arc, or a line if they are equal, turning about its
+        # middle.
+        scale = 8 // self.n
+        left_steps *= scale
+        right_steps *= scale
+        mm = self.eighth()
+        h = self.turn * mm / calibration.wheel_base
+        self.turn += left_steps - right_steps
+        travel = (left_steps + right_steps) * mm / 2
+        if left_steps == right_steps:
+            self.x += travel * math.cos(h)
+            self.y += travel * math.sin(h)
+        else:
+            h2 = self.turn * mm / calibration.wheel_base
+            radius = travel / (h2 - h)
+            self.x += radius * (math.sin(h2) - math.sin(h))
+            self.y -= radius * (math.cos(h2) - math.cos(h))
+
+    def position(self):
+        return self.x, self.y
+
+    def heading(self):
+        return math.degrees(self.turn * self.eighth() / calibration.wheel_base) % 360
+
+    # motion
+
+    def forward(self, distance):
+        if distance < 0:
+            self.backward(-distance)
+            return
+        if self.debug:
+            print("%sforward(%s)" % (self.spacer, distance))
+
+        self.plan(FORWARD, distance)
+
+    def backward(self, distance):
+        if distance < 0:
+            self.forward(-distance)
+            return
+        if self.debug:
+            print("%sbackward(%s)" % (self.spacer, distance))
+
+        self.plan(BACKWARD, distance)
+
+    def left(self, degrees):
+        if (degrees < 0):
+            self.right(-degrees)
+        else:
+            if self.debug:
+                print("%sleft(%s)" % (self.spacer, degrees))
+            rotation = degrees / 360.0
+            distance = calibration.wheel_base * math.pi * rotation
+            self.plan(LEFT, distance)
+
+    def right(self, degrees):
+        if (degrees < 0):
+            self.left(-degrees)
+        else:
+            if self.debug:
+                print("%sright(%s)" % (self.spacer, degrees))
+            rotation = degrees / 360.0
+            distance = calibration.wheel_base * math.pi * rotation
+            self.plan(RIGHT, distance)
+
+    def penup(self):
+        self.set_pen(False)
+        if self.debug:
+            print("penup()")
+
+    def pendown(self):
+        self.set_pen(True)
+        if self.debug:
+            print("pendown()")
+
+    def isdown(self):
+        return self.down
+
+    def set_pen(self, down):
+        self.flush()
+        self.down = down
+        if self.pen is not None:
+            self.pen(down)
+
+    def speed(self, x=None):
+        '''
+        Set the cruise speed of moves to x, from 1 (slowest) to 10
+        (fast), or 0 for the fastest. As in the turtle module, x may
+        also be one of the names in speeds, and numbers above 10 or
+        below 0.5 mean 0.
+
+        Speed 1 never goes faster than calibration.delay_time, speed 0
+        up to calibration.min_delay. Without x, return the current
+        speed.
+        '''
+        if x is None:
+            return self.speed_
+        self.flush()
+
+        x = speeds.get(x, x)
+        if x > 10 or x < 0.5:
+            x = 0
+        self.speed_ = round(x)
+        if self.pace is not None:
+            self.pace(self.speed_)
+
+    # pose planning
+
+    def reversing(self, on):
+        self.reverse = on
+
+    def turn_phases(self, degrees):
+        # phases each wheel takes to turn degrees either way
+        return abs(self.phases(calibration.wheel_base * math.pi * degrees / 360))
+
+    def plan_turn(self, to_angle):
+        # the left turn (negative to turn right) from heading() to
+        # to_angle that takes the fewest phases
+        turn = (to_angle - self.heading()) % 360
+        return turn if self.turn_phases(turn) <= self.turn_phases(turn - 360) else turn - 360
+
+    def plan_pose(self, x, y):
+        # The left turn and forward distance (negative for right and
+        # backward) that take the turtle to (x, y) in the fewest phases:
+        # facing it, or with reversing on, facing away from it.
+        center_x, center_y = self.position()
+        dist = distance((center_x, center_y), (x, y))
+        if self.phases(dist) == 0:
+            return 0, 0
+
+        bearing = getBearing(x, y, center_x, center_y)
+        turn = self.plan_turn(bearing)
+        if self.reverse:
+            back = self.plan_turn(bearing + 180)
+            if self.turn_phases(back) < self.turn_phases(turn):
+                return back, -dist
+        return turn, dist
+
+    def goto(self, x, y):
+        if self.debug:
+            print("goto(%s, %s)" % (x, y))
+        self.spacer = '    '  # offsets debug statements after "goto(x, y)"
+        turn, dist = self.plan_pose(x, y)
+        self.left(turn)
+        self.forward(dist)
+        self.spacer = ''
+
+    def setheading(self, to_angle):
+        '''
+        Set the orientation of the turtle to to_angle.
+
+        Aliases:  setheading | seth
+
+        Argument:
+        to_angle -- a number (integer or float)
+
+        Set the orientation of the turtle to to_angle.
+        Here are some common directions in degrees:
+
+         standard - mode:          logo-mode:
+        -------------------|--------------------
+           0 - east                0 - north
+          90 - north              90 - east
+         180 - west              180 - south
+         270 - south             270 - west
+
+        Example:
+        >>> setheading(90)
+        >>> heading()
+        90
+        '''
+
+        self.left(self.plan_turn(to_angle))
+
+    # circles
+
+    def circle(self, radius, extent=None, steps=None):
+        """ Draw a circle with given radius.
+
+        Arguments:
+        radius -- a number
+        extent (optional) -- a number
+        steps (optional) -- an integer
+
+        Draw a circle with given radius. The center is radius units left
+        of the turtle; extent - an angle - determines which part of the
+        circle is drawn. If extent is not given, draw the entire circle.
+        If extent is not a full circle, one endpoint of the arc is the
+        current pen position. Draw the arc in counterclockwise direction
+        if radius is positive, otherwise in clockwise direction. Finally
+        the direction of the turtle is changed by the amount of extent.
+
+        Without steps, the arc is driven in one continuous move with the
+        wheels turning at different rates. With steps, it is approximated
+        by an inscribed regular polygon with that many sides instead. Maybe
+        used to draw regular polygons.
+
+        call: circle(radius)                  # full circle
+        --or: circle(radius, extent)          # arc
+        --or: circle(radius, extent, steps)
+        --or: circle(radius, steps=6)         # 6-sided polygon
+
+        Example (for a Turtle instance named turtle):
+        >>> turtle.circle(50)
+        >>> turtle.circle(120, 180)  # semicircle
+        """
+
+        if extent is None:
+            extent = 360
+        if steps is None:
+            if self.debug:
+                print("circle(%s, extent=%s)" % (radius, extent))
+            self.drive_circle(radius, extent)
+            return
+        w = 1.0 * extent / steps
+        w2 = 0.5 * w
+        length = 2.0 * radius * math.sin(w2*math.pi/180.0)
+        if radius < 0:
+            length, w, w2 = -length, -w, -w2
+        if self.debug:
+            print("circle(%s, extent=%s, steps=%s)" % (radius, extent, steps))
+        self.left(w2)
+        for i in range(steps):
+            self.forward(length)
+            self.left(w)
+        self.left(-w2)
+
+    def drive_circle(self, radius, extent):
+        # drive extent degrees around a circle of radius (center on the
+        # left for positive radius)
+
+        # signed turn, positive to the left, and the distance each wheel
+        # travels doing it. left() drives the L_stepper wheel forward, so
+        # it is the outer wheel of left turns.
+        theta = math.radians(extent if radius >= 0 else -extent)
+        half = calibration.wheel_base / 2
+        left_steps = self.phases((radius + half) * theta)
+        right_steps = self.phases((radius - half) * theta)
+        self.flush()
+        self.advance(left_steps, right_steps)
+        if left_steps or right_steps:
+            self.drive_arc(left_steps, right_steps)
+
+    def arc(self, angle, radius):
+        '''
+        Draw angle degrees of a circle of radius centered on the turtle,
+        clockwise from its heading, as the Logo ARC primitive. The
+        turtle goes out to the circle and back to the center with the
+        pen up, so it ends where it started, with the same heading and
+        pen.
+        '''
+        if self.debug:
+            print("arc(%s, %s)" % (angle, radius))
+        down = self.down
+        center_x, center_y = self.position()
+        to_angle = self.heading()
+
+        if down:
+            self.penup()
+        self.forward(radius)
+        self.right(90)
+        if down:
+            self.pendown()
+        self.drive_circle(-radius, angle)
+        if down:
+            self.penup()
+        self.goto(center_x, center_y)
+        self.setheading(to_angle)
+        if down:
+            self.pendown()
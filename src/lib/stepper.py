@@ -0,0 +1,287 @@
+# Stepper motor coil driving shared by cpturtle and pyturtle.
+#
+# A StepperBank owns the four coil pins of one motor. It remembers
+# which pattern the coils are in and only writes the pins that differ
+# from it, so moving to the next phase writes one or two pins instead
+# of four. Pins only need a value property, so the same code drives
+# digitalio pins on the robot and SimulatedPin on the host.
+
+import time
+
+# motions of the robot
+FORWARD = 0
+BACKWARD = 1
+LEFT = 2
+RIGHT = 3
+
+# which way the (L_stepper, R_stepper) wheels roll in each motion
+WHEELS = ((1, 1), (-1, -1), (1, -1), (-1, 1))
+
+# Coil patterns of each drive mode. Every mode turns the motor through
+# the same angle in one pass over its patterns, so calibration.steps_rev
+# (passes per revolution) holds for all of them.
+MODES = {
+    # one coil at a time: least current, least torque
+    'wave': [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]],
+    # two coils at a time: most torque
+    'full': [[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1]],
+    # alternating one and two coils: twice the resolution, smoother
+    'half': [[1, 0, 0, 0], [1, 1, 0, 0], [0, 1, 0, 0], [0, 1, 1, 0],
+             [0, 0, 1, 0], [0, 0, 1, 1], [0, 0, 0, 1], [1, 0, 0, 1]],
+}
+
+
+class SimulatedPin:
+    def __init__(self, name):
+        self.name = name
+        self.value = False
+
+
+class StepperBank:
+    def __init__(self, pins, patterns):
+        self.pins = pins
+        self.patterns = patterns
+
+        # coil values in each state; the last state has all coils off
+        off = len(patterns)
+        states = [p for p in patterns] + [[0] * len(pins)]
+
+        # _writes[a][b] is the (pin, value) writes that take the coils
+        # from state a to state b
+        self._writes = tuple(
+            tuple(tuple((pins[bit], states[b][bit]) for bit in range(len(pins))
+                        if states[a][bit] != states[b][bit])
+                  for b in range(off + 1))
+            for a in range(off + 1))
+
+        self.off = off
+        for pin in pins:
+            pin.value = False
+        self.phase = off
+        self.last = 0 # last phase energised
+        self.held = None # pin left on by hold()
+
+    def set_phase(self, phase):
+        # energise the coils for patterns[phase]
+        for pin, value in self._writes[self.phase][phase]:
+            pin.value = value
+        self.phase = phase
+        if phase != self.off:
+            self.last = phase
+
+    def step(self, direction):
+        # move one phase forward (1) or back (-1) through the patterns
+        phase = self.last + direction
+        if phase == self.off:
+            phase = 0
+        elif phase < 0:
+            phase = self.off - 1
+        self.set_phase(phase)
+
+    def release(self):
+        # switch all coils off
+        if self.held is not None:
+            self.held.value = False
+            self.held = None
+        self.set_phase(self.off)
+
+    def hold(self):
+        # Keep only one coil of the phase energised, which holds the
+        # motor with less current. The coils count as off until wake()
+        # energises the phase again, which must be done before stepping.
+        if self.phase == self.off:
+            return
+        pattern = self.patterns[self.phase]
+        keep = pattern.index(1)
+        for bit in range(len(self.pins)):
+            if bit != keep and pattern[bit]:
+                self.pins[bit].value = False
+        self.held = self.pins[keep]
+        self.phase = self.off
+
+    def wake(self):
+        # energise the last phase again after hold() or release()
+        if self.phase == self.off:
+            self.set_phase(self.last)
+            self.held = None
+
+
+class Scheduler:
+    # Paces phases against deadlines on time.monotonic_ns() rather than
+    # sleeping a fixed time after each, so the time spent writing pins
+    # comes out of the wait instead of adding to the step period.
+    #
+    # A phase that starts after its deadline is an overrun: it is
+    # counted, and the following deadlines are counted from then
+    # instead of hurrying to catch up, which could stall the motors.
+
+    def __init__(self):
+        self.deadline = 0
+        self.overruns = 0
+        self.worst = 0 # latest an overrun has been, in ns
+
+    def start(self):
+        self.deadline = time.monotonic_ns()
+
+    def delay(self, period):
+        # the time to wait, in seconds, until period ns after the
+        # previous deadline, which becomes the next deadline
+        deadline = self.deadline + period
+        now = time.monotonic_ns()
+        if now < deadline:
+            self.deadline = deadline
+            return (deadline - now) / 1000000000
+
+        late = now - deadline
+        self.overruns += 1
+        if late > self.worst:
+            self.worst = late
+        self.deadline = now
+        return 0
+
+    def wait(self, period):
+        delay = self.delay(period)
+        if delay:
+            time.sleep(delay)
+
+    def reset(self):
+        self.overruns = 0
+        self.worst = 0
+
+
+class Power:
+    # Eases off the coils of banks while the motors are idle: hold
+    # seconds after a move they are held on one coil per motor, and
+    # release seconds after it they are switched off (None for never).
+    # wake() energises them again before the next move.
+    #
+    # Nothing runs while the robot is idle, so check() has to be called
+    # to make the changes that are due; next() is the time until the
+    # next one. energised and holding count the ns the coils have spent
+    # fully energised and held, up to the last change.
+
+    ENERGISED = 0
+    HOLDING = 1
+    RELEASED = 2
+
+    def __init__(self, banks, hold, release):
+        self.banks = banks
+        self.hold = None if hold is None else int(hold * 1000000000)
+        self.release = None if release is None else int(release * 1000000000)
+        self.state = Power.RELEASED
+        self.since = self.idle = time.monotonic_ns()
+        self.energised = 0
+        self.holding = 0
+
+    def change(self, state):
+        now = time.monotonic_ns()
+        if self.state == Power.ENERGISED:
+            self.energised += now - self.since
+        elif self.state == Power.HOLDING:
+            self.holding += now - self.since
+        self.state = state
+        self.since = now
+
+    def wake(self):
+        if self.state != Power.ENERGISED:
+            for bank in self.banks:
+                bank.wake()
+            self.change(Power.ENERGISED)
+
+    def moved(self):
+        # a move has just ended
+        self.idle = time.monotonic_ns()
+
+    def next(self):
+        # ns until the next change is due, or None if there is none
+        if self.state == Power.ENERGISED and self.hold is not None:
+            due = self.hold
+        elif self.state != Power.RELEASED and self.release is not None:
+            due = self.release
+        else:
+            return None
+        return max(0, self.idle + due - time.monotonic_ns())
+
+    def check(self):
+        idle = time.monotonic_ns() - self.idle
+        if (self.state == Power.ENERGISED and self.hold is not None
+                and idle >= self.hold):
+            for bank in self.banks:
+                bank.hold()
+            self.change(Power.HOLDING)
+        if (self.state != Power.RELEASED and self.release is not None
+                and idle >= self.release):
+            self.off()
+
+    def off(self):
+        for bank in self.banks:
+            bank.release()
+        self.change(Power.RELEASED)
+
+    def totals(self):
+        # (energised, holding) ns, including the current stretch
+        self.change(self.state)
+        return self.energised, self.holding
+
+
+class Move:
+    # A move of the left and right wheels by left_steps and right_steps
+    # phases (negative to roll backward), taken one phase at a time by
+    # tick(). The wheel with fewer steps is stepped Bresenham-style as
+    # its share of the other's steps comes up, so both finish together.
+    #
+    # forward is the motor directions of the FORWARD motion, and ramp,
+    # cruise and n the motion profile (see cpturtle.build_ramp) and the
+    # number of patterns it is indexed by.
+
+    def __init__(self, left_steps, right_steps, forward, ramp, cruise, n):
+        self.left = forward[0] if left_steps >= 0 else -forward[0]
+        self.right = forward[1] if right_steps >= 0 else -forward[1]
+        self.left_steps = abs(left_steps)
+        self.right_steps = abs(right_steps)
+
+        self.steps = max(self.left_steps, self.right_steps)
+        self.left_error = self.right_error = self.steps // 2
+        self.x = 0
+        self.ramp = ramp
+        self.cruise = cruise
+        self.n = n
+
+    def done(self):
+        return self.x >= self.steps
+
+    def tick(self, left_bank, right_bank):
+        # take the next phase, returning the time until the one after
+        # it in ns
+        steps = self.steps
+        x = self.x
+
+        self.left_error += self.left_steps
+        if self.left_error >= steps:
+            self.left_error -= steps
+            left_bank.step(self.left)
+        self.right_error += self.right_steps
+        if self.right_error >= steps:
+            self.right_error -= steps
+            right_bank.step(self.right)
+        self.x = x + 1
+
+        # the ramp is indexed by passes over the patterns from the
+        # nearer end of the move
+        i = (x if x < steps - 1 - x else steps - 1 - x) // self.n
+        return self.ramp[i] if i < len(self.ramp) else self.cruise
+
+
+def motion_directions(invert):
+    '''
+    Return the direction each motor steps in for each motion, indexed
+    by motion, as (left, right) tuples of 1 (forward through the
+    patterns) or -1.
+    '''
+
+    d = -1 if invert else 1
+
+    return ((d, -d),   # FORWARD
+            (-d, d),   # BACKWARD
+            (d, d),    # LEFT
+            (-d, -d))  # RIGHT
@@ -0,0 +1,68 @@
+# Tests of the Logo interpreter on the host. Run with pytest from the
+# top of the repository.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'lib'))
+
+from logo import Logo, BLOCK_CACHE
+
+class Turtle:
+    # turtle adapter that records the moves and turns it is given
+
+    def __init__(self):
+        self.log = []
+
+    def move(self, distance):
+        self.log.append(('move', distance))
+
+    def turn(self, degrees):
+        self.log.append(('turn', degrees))
+
+    def is_io_var(self, name):
+        return False
+
+def run(tokens, checked):
+    turtle = Turtle()
+    Logo(turtle, checked).run(tokens)
+    return turtle.log
+
+@pytest.mark.parametrize('checked', [True, False])
+@pytest.mark.parametrize('tokens', [
+    ['if', ['1', '=', '2'], ['fd', '10'], 'fd', '5'],
+    ['make', '"i', '1', 'while', [':i', '<', '0'], ['fd', '1'], 'fd', '5'],
+    ['make', '"i', '0', 'until', [':i', '=', '0'], ['fd', '1'], 'fd', '5'],
+])
+def test_false_list_condition(tokens, checked):
+    # the value of a condition that pushes no block is not a result of
+    # the statement
+    assert run(tokens, checked) == [('move', 5)]
+
+def test_block_cache_bounded():
+    # lists built while running are compiled, but not all kept
+    logo = Logo(Turtle())
+    logo.run(['repeat', '500', ['make', '"b', ['fd', '1'], 'repeat', '1', ':b']])
+    assert len(logo._blocks) <= BLOCK_CACHE
+
+@pytest.mark.parametrize('checked', [True, False])
+def test_redefine_primitive(checked):
+    with pytest.raises(AssertionError, match="Can't redefine primitive"):
+        run(['to', 'fd', ':x', 'rt', ':x', 'end', 'fd', '10'], checked)
+
+def test_classify_numbers_by_type():
+    logo = Logo(Turtle())
+    assert logo.classify(1.0)[1] is not logo.classify(1)[1]
+    assert type(logo.classify(1)[1]) is int
+
+@pytest.mark.parametrize('checked', [True, False])
+def test_call_site_sees_redefinition(checked):
+    # R redefines G after the call to G has been parsed
+    tokens = ['to', 'g', 'fd', '1', 'end',
+              'to', 'r', 'repeat', '1', ['to', 'g', 'fd', '5', 'end'], 'end',
+              'to', 'k', ':a', ':b', 'end',
+              'k', 'r', 'g']
+    assert run(tokens, checked) == [('move', 5)]
@@ -0,0 +1,572 @@
+#!/bin/env python3
+#
+# Ahead-of-time translator from jslogo token streams to Python.
+#
+# Copyright (C) 2023 University of Rochester
+#
+# Licensed under the MIT License
+#
+# This runs on the host. It reads the same token stream that Logo.run
+# consumes (stored as JSON) and writes a plain Python module in which
+# TO procedures are Python functions, control structures are native
+# loops and motion primitives call cpturtle directly. The result can be
+# compiled with mpy-cross and deployed as turtlecode.mpy, so that no
+# interpreter needs to be loaded on the robot.
+#
+# Only a static subset of Logo is translated: numeric values, global
+# variables and procedure inputs that are not visible to other
+# procedures through dynamic scope, and the primitives listed in
+# STATEMENTS and EXPRESSIONS below. Programs outside that subset are
+# emitted as a module that runs the token stream through the embedded
+# Logo interpreter instead (see --adapter).
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'lib'))
+
+from logo import Logo, TokenStream, UNARY_MINUS, TOKEN_PROCEDURE
+
+class Untranslatable(Exception):
+    pass
+
+# primitives with their canonical names
+ALIASES = {'fd': 'forward', 'bk': 'back', 'lt': 'left', 'rt': 'right',
+           'pu': 'penup', 'pd': 'pendown', 'seth': 'setheading'}
+
+# primitives used as statements, mapped to cpturtle calls
+STATEMENTS = {'forward': 'turtle.forward',
+              'back': 'turtle.backward',
+              'left': 'turtle.left',
+              'right': 'turtle.right',
+              'speed': 'turtle.speed',
+              'arc': 'turtle.arc',
+              'penup': 'turtle.penup',
+              'pendown': 'turtle.pendown',
+              'setxy': '_setxy',
+              'setpos': '_setxy',
+              'home': '_home',
+              'setheading': '_setheading'}
+
+# control structures handled by Translator.statement
+CONTROL = ['repeat', 'forever', 'if', 'ifelse', 'while', 'until',
+           'do.while', 'do.until', 'for', 'dotimes', 'make']
+
+# primitives that produce values
+EXPRESSIONS = ['true', 'false', 'not', 'and', 'or', 'xor']
+
+# variables that the turtle adapter maps to LEDs and the IR emitter
+IO_VARS = ['led1', 'led2', 'emitter']
+
+BINARY = {'+': '+', '-': '-', '*': '*', '/': '/', '%': '%',
+          '<': '<', '>': '>', '=': '==', '<=': '<=', '>=': '>=', '<>': '!='}
+
+class Proc:
+    def __init__(self, name, inputs, block):
+        self.name = name
+        self.inputs = inputs
+        self.block = block
+        self.locals = set(inputs)
+        self.free = set()
+        self.assigned = set()
+
+class Translator:
+    def __init__(self):
+        # only used for its routine table and token predicates
+        self.logo = Logo(None)
+        self.procs = {}
+        self.lines = []
+        self.proc = None # procedure being translated, None at top-level
+        self.tmp = 0
+
+    def canonical(self, word):
+        word = str(word).lower()
+        return ALIASES.get(word, word)
+
+    def isWord(self, atom):
+        return not isinstance(atom, list)
+
+    def arity(self, name):
+        if name in self.procs:
+            return len(self.procs[name].inputs)
+
+        proc = self.logo.routine(name)
+        if proc is None:
+            raise Untranslatable("{} undefined".format(name.upper()))
+
+        return proc['props']['args']
+
+    # procedure definitions
+
+    def collect(self, tokens):
+        # TO runs while its statement is being parsed, so every
+        # top-level definition is known before any body is parsed.
+        main = []
+        tokens = TokenStream(tokens)
+        while len(tokens):
+            atom = tokens.next()
+            if self.isWord(atom) and self.canonical(atom) == 'to':
+                self.to(tokens)
+            else:
+                main.append(atom)
+
+        return main
+
+    def to(self, tokens):
+        name = self.canonical(tokens.next())
+        if name in self.procs:
+            raise Untranslatable("{} is defined more than once".format(name.upper()))
+
+        inputs = []
+        block = []
+        while len(tokens):
+            atom = tokens.next()
+            if self.isWord(atom) and self.canonical(atom) == 'end':
+                self.procs[name] = Proc(name, inputs, block)
+                return
+
+            if not block and self.isWord(atom) and str(atom)[0] == ':':
+                inputs.append(str(atom)[1:].lower())
+            elif not block and not self.isWord(atom):
+                raise Untranslatable("optional and rest inputs are not supported")
+            else:
+                if self.isWord(atom) and self.canonical(atom) == 'to':
+                    raise Untranslatable("nested TO is not supported")
+                block.append(atom)
+
+        raise Untranslatable("TO did not see END")
+
+    # expressions, with the same precedence as Logo.expression
+
+    def expression(self, l):
+        lhs = self.additive(l)
+        while self.logo.peek(l, ['=', '<', '>', '<=', '>=', '<>']):
+            op = l.next()
+            lhs = '(1 if {} {} {} else 0)'.format(lhs, BINARY[op], self.additive(l))
+        return lhs
+
+    def additive(self, l):
+        lhs = self.multiplicative(l)
+        while self.logo.peek(l, ['+', '-']):
+            op = l.next()
+            lhs = '({} {} {})'.format(lhs, BINARY[op], self.multiplicative(l))
+        return lhs
+
+    def multiplicative(self, l):
+        lhs = self.power(l)
+        while self.logo.peek(l, ['*', '/', '%']):
+            op = l.next()
+            lhs = '({} {} {})'.format(lhs, BINARY[op], self.power(l))
+        return lhs
+
+    def power(self, l):
+        lhs = self.unary(l)
+        while self.logo.peek(l, ['^']):
+            l.next()
+            lhs = 'math.pow({}, {})'.format(lhs, self.unary(l))
+        return lhs
+
+    def unary(self, l):
+        if self.logo.peek(l, [UNARY_MINUS]):
+            l.next()
+            return '(-{})'.format(self.unary(l))
+        return self.final(l)
+
+    def final(self, l):
+        if not len(l):
+            raise Untranslatable("Unexpected end of instructions")
+
+        atom = l.next()
+        if not self.isWord(atom):
+            raise Untranslatable("list values are not supported")
+
+        if self.logo.isNumber(atom):
+            return self.number(atom)
+
+        atom = str(atom)
+        if atom[0] == '"' or atom[0] == "'":
+            if self.logo.isNumber(atom[1:]):
+                return self.number(atom[1:])
+            raise Untranslatable("word values are not supported")
+
+        if atom[0] == ':':
+            return self.variable(atom[1:], False)
+
+        if atom[0] == '(':
+            if len(l) and self.isWord(l[0]) and self.known(l[0]):
+                if not (len(l) > 1 and self.isWord(l[1]) and self.logo.isInfix(str(l[1]))):
+                    return self.call(self.canonical(l.next()), l, False)
+
+            result = self.expression(l)
+            if not self.logo.peek(l, [')']):
+                raise Untranslatable("Expecting ')'")
+            l.next()
+            return result
+
+        return self.call(self.canonical(atom), l, True)
+
+    def number(self, atom):
+        # NUMBER only matches the start of a word, so 1E or 2X get here
+        try:
+            return repr(self.logo.number(atom))
+        except ValueError:
+            raise Untranslatable("{} is not a number".format(atom))
+
+    def known(self, word):
+        word = self.canonical(word)
+        return word in self.procs or self.logo.routine(word) is not None
+
+    def args(self, name, l, natural):
+        if natural:
+            return [self.arg(l) for i in range(self.arity(name))]
+
+        args = []
+        while len(l) and not self.logo.peek(l, [')']):
+            args.append(self.arg(l))
+
+        if not len(l):
+            raise Untranslatable("Expecting ')'")
+        l.next()
+
+        return args
+
+    def arg(self, l):
+        # block and condition arguments are kept as token lists
+        if len(l) and not self.isWord(l[0]):
+            return l.next()
+
+        return self.expression(l)
+
+    def call(self, name, l, natural):
+        args = self.args(name, l, natural)
+
+        if name in self.procs:
+            if len(args) != len(self.procs[name].inputs):
+                raise Untranslatable("wrong number of inputs to {}".format(name.upper()))
+            return 'p_{}({})'.format(self.mangle(name), ', '.join(self.value(a) for a in args))
+
+        if name == 'true':
+            return '1'
+        elif name == 'false':
+            return '0'
+        elif name == 'not':
+            return '(0 if {} else 1)'.format(*self.values(args, 1))
+        elif name == 'and':
+            return '(1 if {} else 0)'.format(' and '.join(self.values(args)) or '1')
+        elif name == 'or':
+            return '(1 if {} else 0)'.format(' or '.join(self.values(args)) or '0')
+        elif name == 'xor':
+            # an odd number of true inputs; a != b != c would be chained
+            values = self.values(args)
+            if not values:
+                return '0'
+            return '(sum(1 for _x in ({},) if _x) % 2)'.format(', '.join(values))
+
+        raise Untranslatable("{} is not supported in expressions".format(name.upper()))
+
+    def values(self, args, n = None):
+        if n is not None and len(args) != n:
+            raise Untranslatable("wrong number of inputs")
+        return [self.value(a) for a in args]
+
+    def value(self, arg):
+        if isinstance(arg, str):
+            return arg
+        # a list used as a value: only conditions are evaluated
+        return self.expression(TokenStream(arg))
+
+    # variables
+
+    def mangle(self, name):
+        return ''.join(c if c.isalnum() else '_{:x}_'.format(ord(c)) for c in name.lower())
+
+    def variable(self, name, assign):
+        name = name.lower()
+        if name in IO_VARS:
+            raise Untranslatable(":{} is an I/O variable".format(name))
+
+        if self.proc is not None:
+            if name in self.proc.locals:
+                return 'v_' + self.mangle(name)
+            self.proc.free.add(name)
+            if assign:
+                self.proc.assigned.add(name)
+        return 'g_' + self.mangle(name)
+
+    def name(self, atom):
+        if not self.isWord(atom):
+            raise Untranslatable("variable name expected")
+        atom = str(atom)
+        if atom[0] == '"' or atom[0] == "'":
+            atom = atom[1:]
+        return atom.lower()
+
+    # statements
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def temp(self):
+        self.tmp += 1
+        return '_t{}'.format(self.tmp)
+
+    def block(self, depth, tokens):
+        if self.isWord(tokens):
+            raise Untranslatable("block expected")
+
+        start = len(self.lines)
+        l = TokenStream(tokens)
+        while len(l):
+            self.statement(depth, l)
+
+        if len(self.lines) == start:
+            self.emit(depth, 'pass')
+
+    def statement(self, depth, l):
+        atom = l.next()
+        natural = True
+        if atom == '(' and len(l) and self.isWord(l[0]) and self.known(l[0]):
+            if not (len(l) > 1 and self.isWord(l[1]) and self.logo.isInfix(str(l[1]))):
+                atom = l.next()
+                natural = False
+
+        name = self.canonical(atom) if self.isWord(atom) else None
+        if name in self.procs:
+            self.emit(depth, self.call(name, l, natural))
+        elif name in CONTROL or name in STATEMENTS:
+            if name == 'make':
+                # the variable name is a quoted word, not a value
+                if not natural or not len(l):
+                    raise Untranslatable("{} expects a variable name".format(name.upper()))
+                args = [l.next()] + [self.arg(l) for i in range(self.arity(name) - 1)]
+            else:
+                args = self.args(name, l, natural)
+            self.control(depth, name, args)
+        elif name is not None and self.known(name):
+            raise Untranslatable("{} is not supported".format(name.upper()))
+        elif name is not None and self.logo.classify(atom)[0] == TOKEN_PROCEDURE:
+            raise Untranslatable("{} undefined".format(name.upper()))
+        else:
+            raise Untranslatable("Result supplied when not wanted")
+
+    def control(self, depth, name, args):
+        if name == 'setpos':
+            # the list is not evaluated, so it can only hold numbers
+            pos = args[0]
+            if isinstance(pos, str) or len(pos) != 2 or not all(
+                    self.isWord(a) and self.logo.isNumber(a) for a in pos):
+                raise Untranslatable("SETPOS expects a list of two numbers")
+            args = [self.number(a) for a in pos]
+
+        if name in STATEMENTS:
+            self.emit(depth, '{}({})'.format(STATEMENTS[name], ', '.join(self.values(args))))
+        elif name == 'repeat':
+            self.emit(depth, 'for {} in range(int({})):'.format(self.temp(), self.value(args[0])))
+            self.block(depth + 1, args[1])
+        elif name == 'forever':
+            self.emit(depth, 'while True:')
+            self.block(depth + 1, args[0])
+        elif name == 'if':
+            self.emit(depth, 'if {}:'.format(self.value(args[0])))
+            self.block(depth + 1, args[1])
+            if len(args) > 2:
+                self.emit(depth, 'else:')
+                self.block(depth + 1, args[2])
+        elif name == 'ifelse':
+            self.emit(depth, 'if {}:'.format(self.value(args[0])))
+            self.block(depth + 1, args[1])
+            self.emit(depth, 'else:')
+            self.block(depth + 1, args[2])
+        elif name == 'while':
+            self.emit(depth, 'while {}:'.format(self.value(args[0])))
+            self.block(depth + 1, args[1])
+        elif name == 'until':
+            self.emit(depth, 'while not {}:'.format(self.value(args[0])))
+            self.block(depth + 1, args[1])
+        elif name == 'do.while' or name == 'do.until':
+            self.emit(depth, 'while True:')
+            self.block(depth + 1, args[0])
+            test = 'not ' if name == 'do.while' else ''
+            self.emit(depth + 1, 'if {}{}:'.format(test, self.value(args[1])))
+            self.emit(depth + 2, 'break')
+        elif name == 'for':
+            self.for_(depth, args[0], args[1])
+        elif name == 'dotimes':
+            self.dotimes(depth, args[0], args[1])
+        elif name == 'make':
+            self.emit(depth, '{} = {}'.format(self.variable(self.name(args[0]), True),
+                                              self.value(args[1])))
+
+    def loopvar(self, control):
+        if self.isWord(control) or not len(control):
+            raise Untranslatable("control list expected")
+
+        name = self.name(control[0])
+        if self.proc is not None:
+            self.proc.locals.add(name)
+
+        return self.variable(name, True), TokenStream(control, 1)
+
+    def for_(self, depth, control, block):
+        var, control = self.loopvar(control)
+        current, limit, step = self.temp(), self.temp(), self.temp()
+
+        self.emit(depth, '{} = {}'.format(current, self.expression(control)))
+        self.emit(depth, '{} = {}'.format(limit, self.expression(control)))
+        if len(control):
+            self.emit(depth, '{} = {}'.format(step, self.expression(control)))
+        else:
+            self.emit(depth, '{} = -1 if {} < {} else 1'.format(step, limit, current))
+
+        self.emit(depth, 'while _sign({} - {}) != _sign({}):'.format(current, limit, step))
+        self.emit(depth + 1, '{} = {}'.format(var, current))
+        self.block(depth + 1, block)
+        self.emit(depth + 1, '{} += {}'.format(current, step))
+
+    def dotimes(self, depth, control, block):
+        var, control = self.loopvar(control)
+        current, times = self.temp(), self.temp()
+
+        self.emit(depth, '{} = 1'.format(current))
+        self.emit(depth, '{} = {}'.format(times, self.expression(control)))
+        self.emit(depth, 'while not {} > {}:'.format(current, times))
+        self.emit(depth + 1, '{} = {}'.format(var, current))
+        self.block(depth + 1, block)
+        self.emit(depth + 1, '{} += 1'.format(current))
+
+    # modules
+
+    def translate(self, tokens):
+        main = self.collect(tokens)
+
+        for proc in self.procs.values():
+            self.proc = proc
+            self.emit(0, '')
+            start = len(self.lines)
+            self.emit(1, '') # placeholder for global declarations
+            self.block(1, proc.block)
+            params = ', '.join('v_' + self.mangle(i) for i in proc.inputs)
+            self.lines.insert(start, 'def p_{}({}):'.format(self.mangle(proc.name), params))
+            if proc.assigned:
+                self.lines[start + 1] = '    global ' + ', '.join(
+                    'g_' + self.mangle(n) for n in sorted(proc.assigned))
+            else:
+                del self.lines[start + 1]
+
+        self.proc = None
+        self.emit(0, '')
+        self.block(0, main)
+        self.emit(0, 'turtle.done()')
+
+        # Logo variables are dynamically scoped, so a procedure can see
+        # the inputs and locals of its callers. Those cannot be Python
+        # locals, and they are not translated.
+        locals_ = set()
+        for proc in self.procs.values():
+            locals_ |= proc.locals
+        for proc in self.procs.values():
+            shared = proc.free & locals_
+            if shared:
+                raise Untranslatable("{} uses {} through dynamic scope".format(
+                    proc.name.upper(), ', '.join(':' + n for n in sorted(shared))))
+
+        return self.lines
+
+HEADER = """# Generated by logo2py.py from {source}. Do not edit.
+
+import math
+import cpturtle as turtle
+
+# nothing here reads the detectors, so runs of moves can be merged
+turtle.lookahead(True)
+
+def _sign(x):
+    return -1 if x < 0 else 1 if x > 0 else 0
+
+# Logo puts y along the heading the turtle starts with and x to its
+# right, and measures headings clockwise; cpturtle starts heading along
+# x and measures them anticlockwise. SETXY leaves the heading as it was.
+def _setxy(x, y):
+    h = turtle.heading()
+    turtle.goto(y, -x)
+    turtle.setheading(h)
+
+def _setheading(h):
+    turtle.setheading(-h)
+
+def _home():
+    turtle.goto(0, 0)
+    turtle.setheading(0)
+"""
+
+FALLBACK = """# Generated by logo2py.py from {source}. Do not edit.
+#
+# This program could not be translated ({reason})
+# and runs through the Logo interpreter.
+
+from logo import Logo
+import cpturtle as turtle
+import {module}
+
+Logo({module}.{adapter}(), checked = False).run({tokens!r})
+turtle.done()
+"""
+
+def translate(tokens, source, adapter = None):
+    try:
+        lines = Translator().translate(tokens)
+    except Untranslatable as e:
+        if adapter is None:
+            raise
+
+        module, adapter = adapter.rsplit('.', 1)
+        return FALLBACK.format(source = source, reason = e, module = module,
+                               adapter = adapter, tokens = tokens)
+
+    return HEADER.format(source = source) + '\n'.join(lines) + '\n'
+
+def main():
+    p = argparse.ArgumentParser(description="Translate a jslogo token stream (JSON) to a Python module for the robot")
+    p.add_argument("program", help="JSON file containing the token list passed to Logo.run")
+    p.add_argument("-o", dest="output", help="Output file (default: stdout)")
+    p.add_argument("--adapter", metavar="MODULE.CALLABLE",
+                   help="Turtle adapter for the Logo interpreter, called without arguments. "
+                   "Programs that cannot be translated run through the interpreter with this "
+                   "adapter instead of failing.")
+    p.add_argument("--reorder", action="store_true",
+                   help="Dry-run the program and emit the strokes it draws, reordered to "
+                   "shorten pen-up travel (see strokes.py), instead of translating it. "
+                   "The estimated time saved is reported.")
+
+    args = p.parse_args()
+
+    with open(args.program) as f:
+        tokens = json.load(f)
+
+    if args.reorder:
+        import strokes
+
+        try:
+            code, report = strokes.translate(tokens, os.path.basename(args.program))
+        except strokes.Unsupported as e:
+            print("{}: cannot reorder: {}".format(args.program, e), file=sys.stderr)
+            sys.exit(1)
+        print("{}: {}".format(args.program, report), file=sys.stderr)
+    else:
+        try:
+            code = translate(tokens, os.path.basename(args.program), args.adapter)
+        except Untranslatable as e:
+            print("{}: cannot translate: {}".format(args.program, e), file=sys.stderr)
+            sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(code)
+    else:
+        sys.stdout.write(code)
+
+if __name__ == "__main__":
+    main()
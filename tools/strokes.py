@@ -0,0 +1,290 @@
+#!/bin/env python3
+#
+# Pen-up travel optimizer for Logo plots.
+#
+# Copyright (C) 2023 University of Rochester
+#
+# Licensed under the MIT License
+#
+# This runs on the host, for logo2py.py --reorder. It dry-runs a
+# program through the Logo interpreter with a Recorder as the turtle
+# adapter, which notes the strokes the program draws with the pen down
+# as polylines. optimize() reorders and reverses the strokes to shorten
+# the pen-up travel between them, greedily taking the nearest stroke
+# end first and then improving that order with 2-opt, and emit() writes
+# them as a module of cpturtle.goto calls.
+#
+# Only programs whose drawing does not depend on the robot can be
+# reordered: ones that read the detectors or the button, wait, beep or
+# set the LEDs are rejected, as are arcs, which goto cannot draw.
+
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src', 'lib'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import calibration
+import pyturtle
+from logo import Logo
+from planner import Planner
+
+class Unsupported(Exception):
+    pass
+
+# dry runs that move more often than this are taken not to finish
+MAX_MOVES = 1000000
+
+class Recorder:
+    # Turtle adapter for the Logo interpreter that only tracks the pose,
+    # in Logo coordinates (y up, headings clockwise from north), and the
+    # strokes drawn.
+
+    def __init__(self):
+        self.curx = 0
+        self.cury = 0
+        self.heading = 0
+        self.pen = True
+        self.strokes = []
+        self.stroke = None # stroke being drawn, if the pen is down
+        self.moves = 0
+
+    def moveto(self, x, y):
+        self.moves += 1
+        if self.moves > MAX_MOVES:
+            raise Unsupported("it does not finish within {} moves".format(MAX_MOVES))
+
+        if self.pen and (x, y) != (self.curx, self.cury):
+            stroke = self.stroke
+            if stroke is None:
+                stroke = self.stroke = [(self.curx, self.cury)]
+                self.strokes.append(stroke)
+            elif len(stroke) > 1 and collinear(stroke[-2], stroke[-1], (x, y)):
+                # FD 1 FD 1 draws one line
+                stroke.pop()
+            stroke.append((x, y))
+        self.curx, self.cury = x, y
+
+    def move(self, distance):
+        h = math.radians(self.heading)
+        self.moveto(self.curx + distance * math.sin(h), self.cury + distance * math.cos(h))
+
+    def turn(self, degrees):
+        self.heading = (self.heading + degrees) % 360
+
+    def position(self, p):
+        self.moveto(p[0], p[1])
+
+    def setheading(self, heading):
+        self.heading = heading % 360
+
+    def home(self):
+        self.moveto(0, 0)
+        self.heading = 0
+
+    def towards(self, x, y):
+        return math.degrees(math.atan2(x - self.curx, y - self.cury)) % 360
+
+    def pendown(self, down):
+        self.pen = down
+        if not down:
+            self.stroke = None
+
+    def pendownp(self):
+        return self.pen
+
+    def speed(self, s):
+        pass
+
+    def color(self, color):
+        pass
+
+    def is_io_var(self, name):
+        return str(name).lower() in ('led1', 'led2', 'emitter')
+
+    # the rest depend on the robot or cannot be drawn by goto
+
+    def unsupported(self, name):
+        raise Unsupported("it uses {}".format(name))
+
+    def arc(self, l):
+        self.unsupported('ARC')
+
+    def clearscreen(self):
+        self.unsupported('CLEARSCREEN')
+
+    def setvar(self, name, value):
+        self.unsupported(str(name).upper())
+
+    def buttonp(self):
+        self.unsupported('BUTTONP')
+
+    def leftDetector(self):
+        self.unsupported('LEFTSENSOR')
+
+    def rightDetector(self):
+        self.unsupported('RIGHTSENSOR')
+
+    def wait(self, time):
+        self.unsupported('WAIT')
+
+    def tone(self, frequency, duration):
+        self.unsupported('BEEP')
+
+def collinear(a, b, c):
+    # True if c continues the line from a through b
+    ux, uy = b[0] - a[0], b[1] - a[1]
+    vx, vy = c[0] - b[0], c[1] - b[1]
+    return abs(ux * vy - uy * vx) < 1e-9 * (ux * ux + uy * uy + vx * vx + vy * vy) and ux * vx + uy * vy > 0
+
+def record(tokens):
+    # strokes drawn by the program, as lists of points in Logo
+    # coordinates
+    recorder = Recorder()
+    Logo(recorder).run(tokens)
+    return recorder.strokes
+
+def dist(a, b):
+    return math.hypot(b[0] - a[0], b[1] - a[1])
+
+# order
+
+def ends(strokes, tour):
+    # the (first, last) points of each stroke of tour, which lists
+    # (stroke index, reversed) pairs
+    result = []
+    for i, rev in tour:
+        s = strokes[i]
+        result.append((s[-1], s[0]) if rev else (s[0], s[-1]))
+    return result
+
+def travel(strokes, tour, start = (0, 0)):
+    # pen-up distance driven to draw strokes in the order of tour
+    total = 0
+    at = start
+    for first, last in ends(strokes, tour):
+        total += dist(at, first)
+        at = last
+    return total
+
+def nearest(strokes, start = (0, 0)):
+    # tour that always draws the stroke with the nearest end next,
+    # starting from that end
+    left = set(range(len(strokes)))
+    tour = []
+    at = start
+    while left:
+        best = None
+        for i in left:
+            s = strokes[i]
+            for rev, end in ((False, s[0]), (True, s[-1])):
+                d = dist(at, end)
+                if best is None or d < best[0]:
+                    best = (d, i, rev)
+        d, i, rev = best
+        left.remove(i)
+        tour.append((i, rev))
+        at = strokes[i][0] if rev else strokes[i][-1]
+    return tour
+
+def two_opt(strokes, tour, start = (0, 0)):
+    # Reverses runs of tour, drawing each of their strokes backwards,
+    # while that shortens the travel. Reversing tour[i:j + 1] only
+    # changes the travel into tour[i] and out of tour[j].
+    tour = list(tour)
+    n = len(tour)
+    improved = True
+    while improved:
+        improved = False
+        e = ends(strokes, tour)
+        for i in range(n):
+            before = e[i - 1][1] if i > 0 else start
+            for j in range(i + 1, n):
+                old = dist(before, e[i][0])
+                new = dist(before, e[j][1])
+                if j + 1 < n:
+                    after = e[j + 1][0]
+                    old += dist(e[j][1], after)
+                    new += dist(e[i][0], after)
+                if new < old - 1e-9:
+                    tour[i:j + 1] = [(k, not rev) for k, rev in reversed(tour[i:j + 1])]
+                    e[i:j + 1] = [(last, first) for first, last in reversed(e[i:j + 1])]
+                    improved = True
+    return tour
+
+def optimize(strokes, start = (0, 0)):
+    # strokes reordered, and reversed where that helps, to shorten the
+    # pen-up travel between them
+    tour = two_opt(strokes, nearest(strokes, start), start)
+    return [list(reversed(strokes[i])) if rev else strokes[i] for i, rev in tour]
+
+# estimates
+
+def estimate(strokes, start = (0, 0)):
+    # Seconds to drive strokes, and the pen-up travel between them, with
+    # the goto() calls emit() writes. They are planned as on the robot,
+    # turning either way round and driving forward or backward, by a
+    # Planner that only counts the phases of each move. Each phase takes
+    # calibration.cruise_delay; ramps are not counted.
+    total = [0]
+
+    def drive_arc(left_steps, right_steps):
+        total[0] += max(abs(left_steps), abs(right_steps))
+
+    planner = Planner(len(pyturtle.patterns), drive_arc)
+    planner.lookahead(True)
+    planner.x, planner.y = turtle_point(start)
+    for stroke in strokes:
+        for p in stroke:
+            planner.goto(*turtle_point(p))
+    planner.flush()
+    return total[0] * calibration.cruise_delay / 1000
+
+def report(before, after):
+    b = estimate(before)
+    a = estimate(after)
+    return "{} strokes, pen-up travel {:.0f} mm -> {:.0f} mm, about {:.0f} s -> {:.0f} s ({:.0f} s saved)".format(
+        len(after), travel(before, [(i, False) for i in range(len(before))]),
+        travel(after, [(i, False) for i in range(len(after))]), b, a, b - a)
+
+# output
+
+HEADER = """# Generated by logo2py.py --reorder from {source}. Do not edit.
+#
+# The strokes drawn by the program, reordered to shorten pen-up travel.
+
+import cpturtle as turtle
+
+turtle.lookahead(True)
+"""
+
+def turtle_point(p):
+    # cpturtle coordinates of a point in Logo coordinates: cpturtle
+    # starts at heading 0, along its x axis, where Logo starts north
+    return round(float(p[1]), 3) + 0, round(float(-p[0]), 3) + 0
+
+def point(p):
+    return '{!r}, {!r}'.format(*turtle_point(p))
+
+def emit(strokes, source):
+    lines = [HEADER.format(source = source)]
+    for stroke in strokes:
+        lines.append('turtle.penup()')
+        lines.append('turtle.goto({})'.format(point(stroke[0])))
+        lines.append('turtle.pendown()')
+        for p in stroke[1:]:
+            lines.append('turtle.goto({})'.format(point(p)))
+    lines.append('turtle.penup()')
+    lines.append('turtle.done()')
+    return '\n'.join(lines) + '\n'
+
+def translate(tokens, source):
+    # the module for the reordered strokes of the program, and a report
+    # of the travel and time saved
+    pyturtle.setDebug(False)
+    strokes = record(tokens)
+    reordered = optimize(strokes)
+    return emit(reordered, source), report(strokes, reordered)